@@ -17,6 +17,7 @@ from app.services.import_service import ImportService
 from app.services.optimized_csv_import import OptimizedCSVImportService
 from app.services.optimized_txt_import import OptimizedTXTImportService
 from app.services.compute_service import ComputeService
+from app.services.upload_storage import StoredUpload, UploadTooLarge, safe_file_name, store_upload
 from app.schemas.stock import ImportBatchResponse, ImportUploadResponse
 
 router = APIRouter(prefix="/admin/import", tags=["Import"])
@@ -40,17 +41,35 @@ async def upload_file(
             detail="file_type must be CSV or TXT",
         )
 
-    # Read file content
-    file_content = await file.read()
-    file_size = len(file_content)
-
-    # Validate file size
-    if file_size > settings.MAX_UPLOAD_SIZE:
+    # Stream the upload to disk (hash, size and first line computed on the fly)
+    try:
+        upload = await store_upload(file, settings.UPLOAD_DIR, settings.MAX_UPLOAD_SIZE)
+    except UploadTooLarge as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File too large. Max size: {settings.MAX_UPLOAD_SIZE} bytes",
+            detail=str(e),
         )
 
+    try:
+        return _import_stored_upload(
+            upload, file.filename, file_type, metric_code, data_date, db, current_user
+        )
+    finally:
+        # Synchronous imports are done with the file; queued imports take it over
+        upload.remove()
+
+
+def _import_stored_upload(
+    upload: StoredUpload,
+    file_name: str,
+    file_type: str,
+    metric_code: Optional[str],
+    data_date: Optional[str],
+    db: Session,
+    current_user: User,
+) -> ImportUploadResponse:
+    """Create the batch for a stored upload and import it (sync or queued)."""
+    file_size = upload.size
     import_service = ImportService(db)
 
     # For TXT files, validate metric type
@@ -69,10 +88,10 @@ async def upload_file(
                 )
         else:
             # Try to extract date from filename
-            parsed_date = import_service.extract_date_from_filename(file.filename)
+            parsed_date = import_service.extract_date_from_filename(file_name)
             if not parsed_date:
                 # Try to extract date from file content
-                parsed_date = import_service.extract_date_from_content(file_content)
+                parsed_date = import_service.extract_date_from_content(upload.first_line)
             if not parsed_date:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -83,7 +102,7 @@ async def upload_file(
         if metric_code:
             metric_type = import_service.get_metric_type(metric_code.upper())
         else:
-            metric_type = import_service.detect_metric_type(file.filename)
+            metric_type = import_service.detect_metric_type(file_name)
 
         if not metric_type:
             raise HTTPException(
@@ -96,13 +115,13 @@ async def upload_file(
     # Create batch record
     try:
         batch = import_service.create_batch(
-            file_name=file.filename,
+            file_name=file_name,
             file_type=file_type,
             file_size=file_size,
-            file_content=file_content,
             metric_type_id=metric_type_id,
             data_date=parsed_date,
             user_id=current_user.id,
+            file_hash=upload.sha256,
         )
     except ValueError as e:
         raise HTTPException(
@@ -110,32 +129,23 @@ async def upload_file(
             detail=str(e),
         )
 
-    # Save file temporarily
-    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-    file_path = os.path.join(settings.UPLOAD_DIR, f"{batch.id}_{file.filename}")
-    with open(file_path, "wb") as f:
-        f.write(file_content)
-
     # Process synchronously for small files, async for large files
     if file_size < 1024 * 1024:  # 1MB
         # Process synchronously
         try:
-            # 调用统一导入方法
+            # 调用统一导入方法（直接读取落盘文件）
             if file_type == "CSV":
-                success, errors = import_service.import_csv_file(batch.id, file_content)
+                success, errors = import_service.import_csv_file(batch.id, upload.path)
             else:
-                success, errors = import_service.import_txt_file(
-                    batch.id, file_content, metric_type_id, parsed_date
-                )
-
-            # Clean up file
-            if os.path.exists(file_path):
-                os.remove(file_path)
+                with open(upload.path, "rb") as f:
+                    success, errors = import_service.import_txt_stream(
+                        batch.id, f, metric_type_id, parsed_date
+                    )
 
             db.refresh(batch)
             return ImportUploadResponse(
                 batch_id=batch.id,
-                file_name=file.filename,
+                file_name=file_name,
                 status=batch.status,
                 message="Import completed successfully",
             )
@@ -147,19 +157,23 @@ async def upload_file(
                 detail=f"Import failed: {str(e)}",
             )
     else:
-        # Queue for async processing
+        # Queue for async processing: the task reads and removes the file
         from tasks.import_tasks import process_csv_import, process_txt_import
 
+        file_path = upload.hand_off(
+            os.path.join(settings.UPLOAD_DIR, f"{batch.id}_{safe_file_name(file_name)}")
+        )
+
         if file_type == "CSV":
             process_csv_import.delay(batch.id, file_path)
         else:
             process_txt_import.delay(
-                batch.id, file_path, metric_type_id, data_date
+                batch.id, file_path, metric_type_id, parsed_date.isoformat()
             )
 
         return ImportUploadResponse(
             batch_id=batch.id,
-            file_name=file.filename,
+            file_name=file_name,
             status="pending",
             message="File uploaded. Processing in background",
         )
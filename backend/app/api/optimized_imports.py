@@ -16,6 +16,7 @@ from app.services.optimized_csv_import import OptimizedCSVImportService
 from app.services.optimized_txt_import import OptimizedTXTImportService
 from app.services.parallel_import_service import ParallelTXTImportService, AsyncImportQueue
 from app.services.cache_service import CacheService, ImportStatusCache
+from app.services.upload_storage import StoredUpload, UploadTooLarge, safe_file_name, store_upload
 from app.schemas.stock import ImportBatchResponse, ImportUploadResponse
 
 router = APIRouter(prefix="/import/v2", tags=["Optimized Import"])
@@ -54,17 +55,35 @@ async def upload_file_optimized(
     if file_type not in ("CSV", "TXT"):
         raise HTTPException(status_code=400, detail="file_type must be CSV or TXT")
 
-    # 读取文件内容
-    file_content = await file.read()
-    file_size = len(file_content)
+    # 分块落盘，同时计算哈希、大小和首行
+    try:
+        upload = await store_upload(file, settings.UPLOAD_DIR, settings.MAX_UPLOAD_SIZE)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # 验证文件大小
-    if file_size > settings.MAX_UPLOAD_SIZE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File too large. Max size: {settings.MAX_UPLOAD_SIZE} bytes"
+    try:
+        return _import_stored_upload(
+            upload, file.filename, file_type, metric_code, data_date, use_parallel,
+            background_tasks, db, current_user
         )
+    finally:
+        # 同步导入已用完文件；后台/队列导入已接管文件
+        upload.remove()
 
+
+def _import_stored_upload(
+    upload: StoredUpload,
+    file_name: str,
+    file_type: str,
+    metric_code: Optional[str],
+    data_date: Optional[str],
+    use_parallel: bool,
+    background_tasks: BackgroundTasks,
+    db: Session,
+    current_user: User,
+) -> ImportUploadResponse:
+    """为已落盘的上传创建批次，并按文件大小选择处理方式"""
+    file_size = upload.size
     import_service = ImportService(db)
 
     # 处理TXT文件的指标类型和日期
@@ -79,9 +98,9 @@ async def upload_file_optimized(
             except ValueError:
                 raise HTTPException(status_code=400, detail="Invalid date format")
         else:
-            parsed_date = import_service.extract_date_from_filename(file.filename)
+            parsed_date = import_service.extract_date_from_filename(file_name)
             if not parsed_date:
-                parsed_date = import_service.extract_date_from_content(file_content)
+                parsed_date = import_service.extract_date_from_content(upload.first_line)
             if not parsed_date:
                 raise HTTPException(
                     status_code=400,
@@ -92,7 +111,7 @@ async def upload_file_optimized(
         if metric_code:
             metric_type = import_service.get_metric_type(metric_code.upper())
         else:
-            metric_type = import_service.detect_metric_type(file.filename)
+            metric_type = import_service.detect_metric_type(file_name)
 
         if not metric_type:
             raise HTTPException(
@@ -104,13 +123,13 @@ async def upload_file_optimized(
 
     # 创建批次记录
     batch = import_service.create_batch(
-        file_name=file.filename,
+        file_name=file_name,
         file_type=file_type,
         file_size=file_size,
-        file_content=file_content,
         metric_type_id=metric_type_id,
         data_date=parsed_date,
         user_id=current_user.id,
+        file_hash=upload.sha256,
     )
 
     # 初始化进度
@@ -120,11 +139,11 @@ async def upload_file_optimized(
 
     # 判断处理方式
     if file_size > 10 * 1024 * 1024 and use_parallel:  # 10MB以上且启用并行
-        # 使用并行处理
+        # 使用并行处理（工作进程按偏移直接读取磁盘文件）
         background_tasks.add_task(
             process_large_file_parallel,
             batch.id,
-            file_content,
+            upload.hand_off(_batch_file_path(batch.id, file_name)),
             file_type,
             metric_type_id,
             parsed_date,
@@ -132,7 +151,7 @@ async def upload_file_optimized(
         )
         return ImportUploadResponse(
             batch_id=batch.id,
-            file_name=file.filename,
+            file_name=file_name,
             status="processing",
             message="Large file processing in parallel mode"
         )
@@ -141,7 +160,7 @@ async def upload_file_optimized(
         # 添加到异步队列
         task_info = {
             'batch_id': batch.id,
-            'file_content': file_content,
+            'file_path': upload.hand_off(_batch_file_path(batch.id, file_name)),
             'file_type': file_type,
             'metric_type_id': metric_type_id,
             'metric_code': metric_type.code if metric_type else None,
@@ -151,7 +170,7 @@ async def upload_file_optimized(
 
         return ImportUploadResponse(
             batch_id=batch.id,
-            file_name=file.filename,
+            file_name=file_name,
             status="queued",
             message="File queued for processing"
         )
@@ -161,7 +180,7 @@ async def upload_file_optimized(
         try:
             success, errors = process_file_sync(
                 batch.id,
-                file_content,
+                upload.path,
                 file_type,
                 metric_type_id,
                 parsed_date,
@@ -177,7 +196,7 @@ async def upload_file_optimized(
 
             return ImportUploadResponse(
                 batch_id=batch.id,
-                file_name=file.filename,
+                file_name=file_name,
                 status="completed",
                 message=f"Import completed: {success} success, {errors} errors"
             )
@@ -187,9 +206,14 @@ async def upload_file_optimized(
             raise HTTPException(status_code=500, detail=str(e))
 
 
+def _batch_file_path(batch_id: int, file_name: str) -> str:
+    """移交给后台处理的上传文件路径"""
+    return os.path.join(settings.UPLOAD_DIR, f"{batch_id}_{safe_file_name(file_name)}")
+
+
 def process_file_sync(
     batch_id: int,
-    file_content: bytes,
+    file_path: str,
     file_type: str,
     metric_type_id: Optional[int],
     data_date: Optional[date],
@@ -199,7 +223,7 @@ def process_file_sync(
 
     if file_type == "CSV":
         service = OptimizedCSVImportService(db)
-        return service.parse_and_import_optimized(batch_id, file_content)
+        return service.parse_and_import_optimized(batch_id, file_path)
     else:
         # TXT文件
         import_service = ImportService(db)
@@ -208,20 +232,21 @@ def process_file_sync(
         # 删除旧数据
         import_service.delete_old_metric_data(metric_type_id, data_date, batch_id)
 
-        # 使用优化的导入服务
+        # 使用优化的导入服务，按块读取文件
         service = OptimizedTXTImportService(db)
-        return service.parse_and_import_with_compute(
-            batch_id,
-            file_content,
-            metric_type_id,
-            metric_type.code,
-            data_date
-        )
+        with open(file_path, "rb") as f:
+            return service.parse_and_import_streaming(
+                batch_id,
+                f,
+                metric_type_id,
+                metric_type.code,
+                data_date
+            )
 
 
 async def process_large_file_parallel(
     batch_id: int,
-    file_content: bytes,
+    file_path: str,
     file_type: str,
     metric_type_id: Optional[int],
     data_date: Optional[date],
@@ -249,8 +274,8 @@ async def process_large_file_parallel(
 
             # 使用并行导入服务
             service = ParallelTXTImportService(SessionFactory)
-            success, errors = service.process_large_file(
-                file_content,
+            success, errors = service.process_file(
+                file_path,
                 batch_id,
                 metric_type_id,
                 metric_type.code,
@@ -279,6 +304,11 @@ async def process_large_file_parallel(
         import_service = ImportService(db)
         import_service.update_batch_status(batch_id, "failed", error_message=str(e))
 
+    finally:
+        # 清理上传文件
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
 
 @router.get("/progress/{batch_id}")
 async def get_import_progress(
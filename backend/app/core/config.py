@@ -42,6 +42,15 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = "./uploads"
     MAX_UPLOAD_SIZE: int = 100 * 1024 * 1024  # 100MB
 
+    # TXT Import
+    TXT_IMPORT_ENGINE: str = "columnar"  # columnar: NumPy列式解析; row: 逐行TradeData
+    TXT_IMPORT_PIPELINE: bool = True  # 流式导入时 解析/过滤/COPY 多线程流水线执行
+
+    # CSV Import
+    CSV_MAPPING_SYNC: str = "diff"  # diff: 暂存表比对只增删变化的关系; replace: 先删后插
+    MEMBERSHIP_RECOMPUTE: bool = True  # 股票-概念关系变化后增量重算受影响概念的历史排名/汇总
+    MEMBERSHIP_RECOMPUTE_WORKERS: int = 4  # 按月分区并行的线程数
+
     # Celery
     CELERY_BROKER_URL: str = "redis://localhost:6379/1"
     CELERY_RESULT_BACKEND: str = "redis://localhost:6379/2"
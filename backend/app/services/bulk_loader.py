@@ -0,0 +1,142 @@
+"""批量写入工具 - COPY到临时暂存表，再一次集合式合并到目标表"""
+from io import StringIO
+from typing import Any, Iterable, Mapping, Optional, Sequence, Union
+import csv
+import logging
+
+import numpy as np
+
+from app.services import pg_binary_copy as pgcopy
+
+logger = logging.getLogger(__name__)
+
+# 暂存表中记录输入顺序的列，用于同键去重时保留首条
+SEQ_COLUMN = '_seq'
+
+
+class BulkLoader:
+    """基于 psycopg2 游标的 COPY + INSERT ... SELECT 合并写入
+
+    用法：
+        loader = BulkLoader(cursor)
+        loader.upsert('concept_daily_summary', columns, rows,
+                      conflict_columns=('metric_type_id', 'concept_id', 'trade_date'),
+                      update_columns=('total_value', ...))
+
+    暂存表为会话级临时表（ON COMMIT DROP），不写WAL，事务提交后自动清理。
+    同一冲突键出现多次时保留输入中的第一条，与原 ON CONFLICT DO NOTHING 的逐批插入一致。
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    @staticmethod
+    def staging_table(table: str) -> str:
+        return f"_stage_{table}"
+
+    def stage(
+        self,
+        table: str,
+        columns: Sequence[str],
+        rows: Union[Iterable[Sequence[Any]], pgcopy.ColumnBatch]
+    ) -> int:
+        """建立（或清空）目标表的暂存表，并将 rows COPY 进去
+
+        Args:
+            rows: 与 columns 顺序一致的行（文本COPY，None 写为 NULL），
+                  或列式的 ColumnBatch（二进制COPY）
+
+        Returns:
+            暂存的行数
+        """
+        stage = self.staging_table(table)
+        column_list = ', '.join(columns)
+
+        # 只复制列类型，不带约束/默认值/索引
+        self.cursor.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {stage} ON COMMIT DROP AS
+            SELECT {column_list}, 0::BIGINT AS {SEQ_COLUMN}
+            FROM {table}
+            WITH NO DATA
+        """)
+        self.cursor.execute(f"TRUNCATE {stage}")
+
+        if isinstance(rows, pgcopy.ColumnBatch):
+            seq = pgcopy.int8(np.arange(1, len(rows) + 1, dtype=np.int64))
+            pgcopy.copy_binary(self.cursor, stage, [*columns, SEQ_COLUMN], rows.with_column(seq))
+            return len(rows)
+
+        output = StringIO()
+        writer = csv.writer(output, delimiter='\t')
+        count = 0
+        for count, row in enumerate(rows, 1):
+            writer.writerow((*row, count))
+        output.seek(0)
+
+        self.cursor.copy_expert(
+            f"""
+            COPY {stage} ({column_list}, {SEQ_COLUMN})
+            FROM STDIN WITH (FORMAT CSV, DELIMITER E'\\t', NULL '')
+            """,
+            output
+        )
+        return count
+
+    def merge(
+        self,
+        table: str,
+        columns: Sequence[str],
+        conflict_columns: Sequence[str],
+        update_columns: Optional[Union[Sequence[str], Mapping[str, str]]] = None,
+        touch_column: Optional[str] = None
+    ) -> int:
+        """将暂存表一次性合并到目标表
+
+        Args:
+            update_columns: 冲突时更新的列（取 EXCLUDED 值）；
+                            也可为 列→SQL表达式 的映射，如 {'name': 'COALESCE(EXCLUDED.name, t.name)'}；
+                            为空则 DO NOTHING
+            touch_column: 冲突更新时置为 CURRENT_TIMESTAMP 的列（如 computed_at）
+
+        Returns:
+            写入（插入或更新）的行数
+        """
+        stage = self.staging_table(table)
+        column_list = ', '.join(columns)
+        conflict_list = ', '.join(conflict_columns)
+
+        if update_columns:
+            if isinstance(update_columns, Mapping):
+                assignments = [f"{col} = {expr}" for col, expr in update_columns.items()]
+            else:
+                assignments = [f"{col} = EXCLUDED.{col}" for col in update_columns]
+            if touch_column:
+                assignments.append(f"{touch_column} = CURRENT_TIMESTAMP")
+            on_conflict = f"DO UPDATE SET {', '.join(assignments)}"
+        else:
+            on_conflict = "DO NOTHING"
+
+        # DISTINCT ON 去掉同键重复行，否则 DO UPDATE 会因同一行被更新两次而报错
+        self.cursor.execute(f"""
+            INSERT INTO {table} ({column_list})
+            SELECT DISTINCT ON ({conflict_list}) {column_list}
+            FROM {stage}
+            ORDER BY {conflict_list}, {SEQ_COLUMN}
+            ON CONFLICT ({conflict_list}) {on_conflict}
+        """)
+        return self.cursor.rowcount
+
+    def upsert(
+        self,
+        table: str,
+        columns: Sequence[str],
+        rows: Union[Iterable[Sequence[Any]], pgcopy.ColumnBatch],
+        conflict_columns: Sequence[str],
+        update_columns: Optional[Union[Sequence[str], Mapping[str, str]]] = None,
+        touch_column: Optional[str] = None
+    ) -> int:
+        """stage + merge"""
+        staged = self.stage(table, columns, rows)
+        if not staged:
+            return 0
+        return self.merge(table, columns, conflict_columns, update_columns, touch_column)
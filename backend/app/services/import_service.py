@@ -9,11 +9,12 @@ For actual CSV/TXT data parsing and importing, use:
 """
 import hashlib
 from datetime import datetime, date
-from typing import Optional, Tuple
+from typing import BinaryIO, Optional, Tuple, Union
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy import text
 
+from app.core.config import settings
 from app.models.stock import (
     ImportBatch,
     MetricType,
@@ -43,13 +44,21 @@ class ImportService:
         file_name: str,
         file_type: str,
         file_size: int,
-        file_content: bytes,
+        file_content: Optional[bytes] = None,
         metric_type_id: Optional[int] = None,
         data_date: Optional[date] = None,
         user_id: Optional[int] = None,
+        file_hash: Optional[str] = None,
     ) -> ImportBatch:
-        """Create an import batch record."""
-        file_hash = hashlib.sha256(file_content).hexdigest()
+        """Create an import batch record.
+
+        Pass ``file_hash`` when the SHA-256 was already computed while streaming
+        the upload to disk; ``file_content`` is only hashed when it is missing.
+        """
+        if file_hash is None:
+            if file_content is None:
+                raise ValueError("file_content or file_hash is required")
+            file_hash = hashlib.sha256(file_content).hexdigest()
 
         # Check for duplicate - if exists, mark old batch as replaced
         existing = (
@@ -193,7 +202,11 @@ class ImportService:
         return None
 
     def extract_date_from_content(self, file_content: bytes) -> Optional[date]:
-        """Extract date from file content (first line, second column)."""
+        """Extract date from file content (first line, second column).
+
+        Only the first line is needed, so ``StoredUpload.first_line`` can be passed
+        instead of the whole file.
+        """
         try:
             # Try UTF-8 first
             content = file_content.decode('utf-8')
@@ -243,7 +256,7 @@ class ImportService:
         包含：
         1. 数据库锁（防止并发导入同一指标+日期）
         2. 删除旧数据
-        3. 导入原始数据和计算排名汇总
+        3. 导入原始数据和计算排名汇总（解析引擎由 settings.TXT_IMPORT_ENGINE 决定）
         4. 更新batch状态
 
         Args:
@@ -255,6 +268,62 @@ class ImportService:
         Returns:
             (success_count, error_count)
         """
+        metric_type = self._begin_txt_import(batch_id, metric_type_id, data_date)
+
+        # 导入数据和计算排名汇总
+        from app.services.optimized_txt_import import OptimizedTXTImportService
+        txt_service = OptimizedTXTImportService(self.db)
+        if settings.TXT_IMPORT_ENGINE == "row":
+            success, errors = txt_service.parse_and_import_with_compute(
+                batch_id, file_content, metric_type_id, metric_type.code, data_date
+            )
+        else:
+            success, errors = txt_service.parse_and_import_columnar(
+                batch_id, file_content, metric_type_id, metric_type.code, data_date
+            )
+
+        self._finish_txt_import(batch_id, success, errors)
+        return success, errors
+
+    def import_txt_stream(
+        self,
+        batch_id: int,
+        stream: BinaryIO,
+        metric_type_id: int,
+        data_date: date
+    ) -> Tuple[int, int]:
+        """
+        流式TXT导入：与 import_txt_file 流程相同，但按块读取文件流，
+        适用于大文件（内存占用与文件大小无关）。
+        TXT_IMPORT_PIPELINE 开启时解析、过滤、COPY 在不同线程上流水线执行。
+
+        Args:
+            batch_id: 导入批次ID
+            stream: 以二进制模式打开的文件流
+            metric_type_id: 指标类型ID
+            data_date: 数据日期
+
+        Returns:
+            (success_count, error_count)
+        """
+        metric_type = self._begin_txt_import(batch_id, metric_type_id, data_date)
+
+        from app.services.optimized_txt_import import OptimizedTXTImportService
+        txt_service = OptimizedTXTImportService(self.db)
+        if settings.TXT_IMPORT_PIPELINE:
+            success, errors = txt_service.parse_and_import_pipelined(
+                batch_id, stream, metric_type_id, metric_type.code, data_date
+            )
+        else:
+            success, errors = txt_service.parse_and_import_streaming(
+                batch_id, stream, metric_type_id, metric_type.code, data_date
+            )
+
+        self._finish_txt_import(batch_id, success, errors)
+        return success, errors
+
+    def _begin_txt_import(self, batch_id: int, metric_type_id: int, data_date: date) -> MetricType:
+        """TXT导入前置步骤：加锁、更新状态、删除旧数据"""
         # 获取metric_type
         metric_type = self.get_metric_type_by_id(metric_type_id)
         if not metric_type:
@@ -274,14 +343,10 @@ class ImportService:
         # 删除旧数据（相同指标+日期的其他batch数据）
         self.delete_old_metric_data(metric_type_id, data_date, batch_id)
 
-        # 导入数据和计算排名汇总
-        from app.services.optimized_txt_import import OptimizedTXTImportService
-        txt_service = OptimizedTXTImportService(self.db)
-        success, errors = txt_service.parse_and_import_with_compute(
-            batch_id, file_content, metric_type_id, metric_type.code, data_date
-        )
+        return metric_type
 
-        # 更新状态为completed
+    def _finish_txt_import(self, batch_id: int, success: int, errors: int):
+        """TXT导入收尾：更新状态为completed"""
         self.update_batch_status(
             batch_id, "completed",
             total_rows=success + errors,
@@ -289,12 +354,10 @@ class ImportService:
             error_rows=errors,
         )
 
-        return success, errors
-
     def import_csv_file(
         self,
         batch_id: int,
-        file_content: bytes
+        file_content: Union[bytes, str, BinaryIO]
     ) -> Tuple[int, int]:
         """
         统一的CSV文件导入方法（基于页面导入逻辑）
@@ -303,10 +366,11 @@ class ImportService:
         1. 数据库锁（防止并发导入）
         2. 导入股票-概念关系数据
         3. 更新batch状态
+        4. 关系有变化时，增量重算受影响概念的历史排名和汇总
 
         Args:
             batch_id: 导入批次ID
-            file_content: 文件内容
+            file_content: 文件内容，或已落盘文件的路径/二进制流
 
         Returns:
             (success_count, error_count)
@@ -333,4 +397,16 @@ class ImportService:
             error_rows=errors,
         )
 
+        if settings.MEMBERSHIP_RECOMPUTE and csv_service.membership_changes:
+            self._recompute_membership(csv_service.membership_changes)
+
         return success, errors
+
+    def _recompute_membership(self, changes):
+        """按关系变更集重算受影响概念（各分区使用独立会话并行执行）"""
+        from app.services.membership_recompute import MembershipRecomputeService
+        session_factory = sessionmaker(bind=self.db.get_bind())
+        MembershipRecomputeService(
+            session_factory,
+            max_workers=settings.MEMBERSHIP_RECOMPUTE_WORKERS
+        ).recompute(changes)
@@ -0,0 +1,213 @@
+"""股票-概念成员关系索引 - CSR压缩存储与向量化分组排名"""
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+
+@dataclass
+class ConceptRanking:
+    """按概念分组排序后的结果（行级数组已按 概念、排名 排序）"""
+    concept_ids: np.ndarray  # int32，每行所属概念
+    stock_idx: np.ndarray  # int32，每行的股票下标
+    trade_values: np.ndarray  # int64
+    ranks: np.ndarray  # int32，概念内排名（从1开始）
+    segment_starts: np.ndarray  # int64，每个概念在行级数组中的起始位置
+    segment_counts: np.ndarray  # int64，每个概念的股票数
+
+    @classmethod
+    def from_sorted(cls, concept_ids: np.ndarray, stock_idx: np.ndarray, trade_values: np.ndarray) -> "ConceptRanking":
+        """由已按 (概念, 交易值降序) 排好的行构建，计算分段和概念内排名"""
+        n = len(concept_ids)
+        if n:
+            boundary = np.empty(n, dtype=bool)
+            boundary[0] = True
+            np.not_equal(concept_ids[1:], concept_ids[:-1], out=boundary[1:])
+            segment_starts = np.flatnonzero(boundary)
+        else:
+            segment_starts = np.empty(0, dtype=np.int64)
+        segment_counts = np.diff(np.append(segment_starts, n))
+
+        ranks = np.arange(n) - np.repeat(segment_starts, segment_counts) + 1
+
+        return cls(
+            concept_ids=concept_ids.astype(np.int32, copy=False),
+            stock_idx=stock_idx.astype(np.int32, copy=False),
+            trade_values=trade_values.astype(np.int64, copy=False),
+            ranks=ranks.astype(np.int32, copy=False),
+            segment_starts=segment_starts.astype(np.int64, copy=False),
+            segment_counts=segment_counts.astype(np.int64, copy=False),
+        )
+
+    @classmethod
+    def merge(cls, parts: Sequence["ConceptRanking"]) -> "ConceptRanking":
+        """合并多段部分排名（如各进程对文件分块的结果）
+
+        parts 按原始输入顺序给出；同值时靠前的段在前，
+        结果与对整体输入直接调用 rank_within_concepts 完全一致。
+        """
+        if not parts:
+            empty = np.empty(0, dtype=np.int32)
+            return cls.from_sorted(empty, empty, np.empty(0, dtype=np.int64))
+
+        concept_ids = np.concatenate([p.concept_ids for p in parts])
+        stock_idx = np.concatenate([p.stock_idx for p in parts])
+        values = np.concatenate([p.trade_values for p in parts])
+
+        order = sorted_order(concept_ids, values)
+        return cls.from_sorted(concept_ids[order], stock_idx[order], values[order])
+
+    @property
+    def segment_concepts(self) -> np.ndarray:
+        """每个分段对应的概念ID"""
+        return self.concept_ids[self.segment_starts]
+
+    def summary_arrays(self) -> Dict[str, np.ndarray]:
+        """按概念计算 total/avg/max/min/median，结果与逐概念的Python实现一致"""
+        if len(self.segment_starts) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return {k: empty for k in ('total', 'avg', 'max', 'min', 'median')}
+
+        starts = self.segment_starts
+        counts = self.segment_counts
+        values = self.trade_values
+
+        totals = np.add.reduceat(values, starts)
+        ends = starts + counts - 1
+
+        # 分段内按降序排列：中位数取升序位置 n//2（奇数）或 n//2-1 与 n//2 的均值
+        mid_hi = starts + counts // 2
+        mid_lo = starts + (counts - 1) // 2
+        medians = (values[mid_hi] + values[mid_lo]) // 2
+        odd = counts % 2 == 1
+        medians[odd] = values[mid_hi[odd]]
+
+        return {
+            'total': totals,
+            'avg': totals // counts,
+            'max': values[starts],
+            'min': values[ends],
+            'median': medians,
+        }
+
+
+class ConceptMembershipIndex:
+    """股票→概念 的CSR索引
+
+    stock_codes[i] 的概念为 concept_ids[indptr[i]:indptr[i + 1]]。
+    按概念分组只需一次按下标的整体取值，排名为一次分段排序。
+    """
+
+    def __init__(self, stock_codes: List[str], indptr: np.ndarray, concept_ids: np.ndarray):
+        self.stock_codes = stock_codes
+        self.stock_index: Dict[str, int] = {code: i for i, code in enumerate(stock_codes)}
+        self.indptr = indptr
+        self.concept_ids = concept_ids
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[Tuple[str, int]]) -> "ConceptMembershipIndex":
+        """由 (stock_code, concept_id) 对构建，保持每只股票内概念的出现顺序"""
+        mapping: Dict[str, List[int]] = {}
+        for stock_code, concept_id in pairs:
+            mapping.setdefault(stock_code, []).append(concept_id)
+        return cls.from_mapping(mapping)
+
+    @classmethod
+    def from_mapping(cls, stock_concepts_map: Dict[str, List[int]]) -> "ConceptMembershipIndex":
+        """由 股票→概念ID列表 的字典构建"""
+        stock_codes = list(stock_concepts_map.keys())
+        counts = np.fromiter(
+            (len(stock_concepts_map[code]) for code in stock_codes),
+            dtype=np.int64,
+            count=len(stock_codes),
+        )
+        indptr = np.zeros(len(stock_codes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+
+        concept_ids = np.fromiter(
+            (cid for code in stock_codes for cid in stock_concepts_map[code]),
+            dtype=np.int32,
+            count=int(indptr[-1]),
+        )
+        return cls(stock_codes, indptr, concept_ids)
+
+    def __len__(self) -> int:
+        return len(self.stock_codes)
+
+    @property
+    def num_memberships(self) -> int:
+        return len(self.concept_ids)
+
+    def lookup(self, stock_codes: Sequence[str]) -> np.ndarray:
+        """股票代码→股票下标，不在索引中的返回 -1"""
+        get = self.stock_index.get
+        return np.fromiter(
+            (get(code, -1) for code in stock_codes),
+            dtype=np.int32,
+            count=len(stock_codes),
+        )
+
+    def concepts_of(self, stock_code: str) -> np.ndarray:
+        """单只股票的概念ID"""
+        i = self.stock_index.get(stock_code)
+        if i is None:
+            return self.concept_ids[:0]
+        return self.concept_ids[self.indptr[i]:self.indptr[i + 1]]
+
+    def expand(self, stock_idx: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """把每行展开为其所属的全部概念
+
+        Returns:
+            (row_positions, concept_ids)：row_positions 为展开后每行对应的输入行下标
+        """
+        stock_idx = np.asarray(stock_idx)
+        starts = self.indptr[stock_idx]
+        counts = self.indptr[stock_idx + 1] - starts
+
+        row_positions = np.repeat(np.arange(len(stock_idx)), counts)
+        # 展开行在各自CSR区间内的偏移
+        offsets = np.arange(len(row_positions)) - np.repeat(np.cumsum(counts) - counts, counts)
+        concept_ids = self.concept_ids[np.repeat(starts, counts) + offsets]
+        return row_positions, concept_ids
+
+    def rank_within_concepts(self, stock_idx: np.ndarray, trade_values: np.ndarray) -> ConceptRanking:
+        """按概念分组并按交易值降序排名（分段排序）
+
+        同值按输入顺序排列，与逐概念 sorted(..., reverse=True) 的结果一致。
+        stock_idx 中为 -1 的行（无概念关联）会被忽略。
+        """
+        stock_idx = np.asarray(stock_idx, dtype=np.int64)
+        trade_values = np.asarray(trade_values, dtype=np.int64)
+
+        known = stock_idx >= 0
+        if not known.all():
+            stock_idx = stock_idx[known]
+            trade_values = trade_values[known]
+
+        row_positions, concept_ids = self.expand(stock_idx)
+        values = trade_values[row_positions]
+
+        # 主键：概念；次键：交易值降序；稳定排序，同值保持输入顺序
+        order = sorted_order(concept_ids, values)
+        return ConceptRanking.from_sorted(
+            concept_ids[order],
+            stock_idx[row_positions[order]],
+            values[order],
+        )
+
+
+def sorted_order(concept_ids: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """按 (概念升序, 值降序) 的稳定排序下标，等价于 np.lexsort((-values, concept_ids))
+
+    取值范围允许时把两个键打包为一个 int64 后用 timsort（kind='stable'）排序：
+    输入由多个已排好序的段拼接而成时，timsort 识别出各段后只做段间归并（k路归并）。
+    """
+    n = len(values)
+    if n:
+        v_min, v_max = int(values.min()), int(values.max())
+        c_min, c_max = int(concept_ids.min()), int(concept_ids.max())
+        if c_min >= 0 and c_max < 2 ** 31 and v_max - v_min < 2 ** 32:
+            key = concept_ids.astype(np.int64) << 32
+            key |= (v_max - values).astype(np.int64)
+            return np.argsort(key, kind='stable')
+    return np.lexsort((-values, concept_ids))
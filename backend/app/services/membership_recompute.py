@@ -0,0 +1,222 @@
+"""成员关系增量重算 - 股票-概念关系变化后，只重建受影响概念的排名和汇总
+
+CSV导入会改写 stock_concepts，已落库的历史日期的
+concept_stock_daily_rank / concept_daily_summary 随之过期。
+这里按导入给出的变更集 (concept_id, stock_code) 找出受影响的概念，
+以 stock_metric_data_raw 中已存储的交易值为输入，按月分区并行重建这些概念的全部历史数据。
+
+排名语义与TXT导入的内存排名一致：
+- 概念内按交易值降序、同值按源行号排列（ROW_NUMBER）
+- 同一股票在同一日重复出现时，排名行保留排名最靠前的一条，汇总统计包含全部行
+
+注意：TXT导入时不属于任何概念的股票不会写入原始数据表，
+这类股票新加入概念后，历史日期无数据可补，只能在重新导入对应日期后出现。
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# 默认并行的分区数
+DEFAULT_RECOMPUTE_WORKERS = 4
+
+
+@dataclass
+class MembershipChanges:
+    """一次导入产生的股票-概念关系变更，元素为 (concept_id, stock_code)"""
+    added: Set[Tuple[int, str]] = field(default_factory=set)
+    removed: Set[Tuple[int, str]] = field(default_factory=set)
+
+    @classmethod
+    def diff(cls, old_pairs: Iterable[Tuple[int, str]], new_pairs: Iterable[Tuple[int, str]]) -> "MembershipChanges":
+        old_pairs, new_pairs = set(old_pairs), set(new_pairs)
+        return cls(added=new_pairs - old_pairs, removed=old_pairs - new_pairs)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed)
+
+    @property
+    def affected_concepts(self) -> FrozenSet[int]:
+        return frozenset(concept_id for concept_id, _ in self.added | self.removed)
+
+
+@dataclass(frozen=True)
+class RecomputePartition:
+    """一个重算单元：某指标在一个月分区内的全部交易日"""
+    metric_type_id: int
+    month_start: date
+    month_end: date
+
+
+DELETE_PARTITION_SQL = """
+    DELETE FROM {table}
+    WHERE metric_type_id = :metric_type_id
+      AND trade_date BETWEEN :month_start AND :month_end
+      AND concept_id = ANY(:concept_ids)
+"""
+
+# 两张结果表共用一次窗口计算，由原始数据重建受影响概念在分区内的行
+RECOMPUTE_PARTITION_SQL = """
+    WITH ranked AS MATERIALIZED (
+        SELECT
+            r.metric_type_id,
+            r.metric_code,
+            sc.concept_id,
+            r.stock_code,
+            r.trade_date,
+            r.trade_value,
+            r.import_batch_id,
+            ROW_NUMBER() OVER w AS rank,
+            COUNT(*) OVER (PARTITION BY sc.concept_id, r.trade_date) AS member_rows
+        FROM stock_metric_data_raw r
+        JOIN stock_concepts sc ON sc.stock_code = r.stock_code
+        WHERE r.metric_type_id = :metric_type_id
+          AND r.trade_date BETWEEN :month_start AND :month_end
+          AND sc.concept_id = ANY(:concept_ids)
+        WINDOW w AS (PARTITION BY sc.concept_id, r.trade_date ORDER BY r.trade_value DESC, r.source_row_number)
+    ),
+    inserted_ranks AS (
+        INSERT INTO concept_stock_daily_rank (
+            metric_type_id, metric_code, concept_id, stock_code,
+            trade_date, trade_value, rank, import_batch_id
+        )
+        SELECT DISTINCT ON (concept_id, stock_code, trade_date)
+            metric_type_id, metric_code, concept_id, stock_code,
+            trade_date, trade_value, rank, import_batch_id
+        FROM ranked
+        ORDER BY concept_id, stock_code, trade_date, rank
+        RETURNING 1
+    ),
+    inserted_summaries AS (
+        INSERT INTO concept_daily_summary (
+            metric_type_id, metric_code, concept_id, trade_date,
+            total_value, avg_value, max_value, min_value, median_value, import_batch_id
+        )
+        SELECT
+            metric_type_id,
+            MIN(metric_code),
+            concept_id,
+            trade_date,
+            SUM(trade_value),
+            FLOOR(SUM(trade_value) / COUNT(*))::BIGINT,
+            MAX(trade_value),
+            MIN(trade_value),
+            -- 降序第 n//2 与 (n-1)//2 位（从0计）的均值向下取整，奇数时两者相同
+            FLOOR((
+                MIN(trade_value) FILTER (WHERE rank = member_rows / 2 + 1)
+                + MIN(trade_value) FILTER (WHERE rank = (member_rows - 1) / 2 + 1)
+            )::NUMERIC / 2)::BIGINT,
+            MAX(import_batch_id)
+        FROM ranked
+        GROUP BY metric_type_id, concept_id, trade_date
+        RETURNING 1
+    )
+    SELECT
+        (SELECT COUNT(*) FROM inserted_ranks) AS rank_rows,
+        (SELECT COUNT(*) FROM inserted_summaries) AS summary_rows
+"""
+
+
+class MembershipRecomputeService:
+    """按月分区并行重算受影响概念的历史排名和汇总
+
+    每个分区使用独立的数据库会话和事务，分区之间互不阻塞；
+    单个分区内删除和重建在同一事务中完成，失败时该分区整体回滚。
+    """
+
+    def __init__(self, db_session_factory: Callable[[], Session], max_workers: int = DEFAULT_RECOMPUTE_WORKERS):
+        self.db_session_factory = db_session_factory
+        self.max_workers = max_workers
+
+    def recompute(self, changes: MembershipChanges) -> Dict[str, int]:
+        """根据关系变更集重算，返回统计"""
+        if not changes:
+            return {'concepts': 0, 'partitions': 0, 'rank_rows': 0, 'summary_rows': 0}
+        logger.info(f"成员关系变更: 新增{len(changes.added)}条, 移除{len(changes.removed)}条")
+        return self.recompute_concepts(changes.affected_concepts)
+
+    def recompute_concepts(
+        self,
+        concept_ids: Iterable[int],
+        metric_type_ids: Optional[Iterable[int]] = None
+    ) -> Dict[str, int]:
+        """重建指定概念在所有已存储日期上的排名和汇总
+
+        Args:
+            concept_ids: 受影响的概念ID
+            metric_type_ids: 只重算这些指标；为空则为全部已计算过的指标
+        """
+        concept_ids = sorted(set(concept_ids))
+        stats = {'concepts': len(concept_ids), 'partitions': 0, 'rank_rows': 0, 'summary_rows': 0}
+        if not concept_ids:
+            return stats
+
+        partitions = self._list_partitions(metric_type_ids)
+        stats['partitions'] = len(partitions)
+        if not partitions:
+            return stats
+
+        workers = max(1, min(self.max_workers, len(partitions)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for rank_rows, summary_rows in executor.map(
+                lambda partition: self._recompute_partition(partition, concept_ids),
+                partitions
+            ):
+                stats['rank_rows'] += rank_rows
+                stats['summary_rows'] += summary_rows
+
+        logger.info(
+            f"增量重算完成: {stats['concepts']}个概念, {stats['partitions']}个分区, "
+            f"{stats['rank_rows']}条排名, {stats['summary_rows']}条汇总"
+        )
+        return stats
+
+    def _list_partitions(self, metric_type_ids: Optional[Iterable[int]]) -> List[RecomputePartition]:
+        """已有计算结果的 (指标, 月份)，汇总表远小于原始数据表"""
+        sql = """
+            SELECT
+                metric_type_id,
+                date_trunc('month', trade_date)::date AS month_start,
+                (date_trunc('month', trade_date) + INTERVAL '1 month - 1 day')::date AS month_end
+            FROM concept_daily_summary
+        """
+        params = {}
+        if metric_type_ids is not None:
+            sql += " WHERE metric_type_id = ANY(:metric_type_ids)"
+            params['metric_type_ids'] = list(metric_type_ids)
+        sql += " GROUP BY 1, 2, 3 ORDER BY 2, 1"
+
+        db = self.db_session_factory()
+        try:
+            rows = db.execute(text(sql), params).fetchall()
+        finally:
+            db.close()
+        return [RecomputePartition(r.metric_type_id, r.month_start, r.month_end) for r in rows]
+
+    def _recompute_partition(self, partition: RecomputePartition, concept_ids: List[int]) -> Tuple[int, int]:
+        params = {
+            'metric_type_id': partition.metric_type_id,
+            'month_start': partition.month_start,
+            'month_end': partition.month_end,
+            'concept_ids': concept_ids,
+        }
+        db = self.db_session_factory()
+        try:
+            # 先删后建：同一语句内的DELETE与INSERT执行顺序不确定，会触发唯一键冲突
+            for table in ('concept_stock_daily_rank', 'concept_daily_summary'):
+                db.execute(text(DELETE_PARTITION_SQL.format(table=table)), params)
+            row = db.execute(text(RECOMPUTE_PARTITION_SQL), params).one()
+            db.commit()
+            return row.rank_rows, row.summary_rows
+        except Exception:
+            db.rollback()
+            logger.error(f"分区重算失败: 指标{partition.metric_type_id} {partition.month_start:%Y-%m}")
+            raise
+        finally:
+            db.close()
@@ -1,20 +1,53 @@
 """优化的CSV导入服务 - 股票概念映射"""
-from typing import Dict, Set, List, Tuple
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Set, List, Optional, Tuple, Union
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+import numpy as np
 import pandas as pd
-from io import BytesIO, StringIO
-import csv
+from io import BytesIO
+
+from app.core.config import settings
+from app.services import pg_binary_copy as pgcopy
+from app.services.bulk_loader import BulkLoader
+from app.services.membership_recompute import MembershipChanges
+
+RAW_MAPPING_COLUMNS = (
+    'import_batch_id', 'stock_code', 'stock_name', 'concept_name',
+    'industry_name', 'source_row_number', 'is_valid'
+)
+
+
+def _text_column(values: pd.Series) -> pgcopy.TextColumn:
+    """字符串列字典编码为COPY文本列，缺失值写为NULL"""
+    codes, uniques = pd.factorize(values)
+    table = list(uniques) + [None]
+    codes[codes < 0] = len(uniques)
+    return pgcopy.text(table, codes)
+
+
+@dataclass
+class CSVImportFrames:
+    """CSV收集阶段的结果：每个目标表一帧，列即写入列"""
+    stocks: pd.DataFrame  # 新股票：stock_code, stock_name
+    concepts: pd.DataFrame  # 新概念：concept_name
+    industries: pd.DataFrame  # 新行业：industry_name
+    stock_concepts: pd.DataFrame  # 股票-概念：stock_code, concept_name（逐行，可含重复）
+    stock_industries: pd.DataFrame  # 股票-行业：stock_code, industry_name
+    raw: pd.DataFrame  # 审计行：stock_code, stock_name, concept_name, industry_name, source_row_number
 
 
 class OptimizedCSVImportService:
     """优化的CSV导入服务：高效处理股票-概念映射关系和行业映射"""
 
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, mapping_sync: Optional[str] = None):
         self.db = db
+        # diff: 暂存表比对后只增删变化的关系；replace: 删除涉及股票的全部关系后重新插入
+        self.mapping_sync = mapping_sync or settings.CSV_MAPPING_SYNC
         self.concept_cache: Dict[str, int] = {}  # 概念名称到ID的缓存
         self.stock_cache: Set[str] = set()  # 已存在的股票代码缓存
         self.industry_cache: Dict[str, int] = {}  # 行业名称到ID的缓存
+        self.membership_changes = MembershipChanges()  # 本次导入的股票-概念关系变更
 
     def preload_cache(self):
         """预加载缓存数据，减少查询"""
@@ -39,240 +72,257 @@ class OptimizedCSVImportService:
     def parse_and_import_optimized(
         self,
         batch_id: int,
-        file_content: bytes
+        file_content: Union[bytes, str, BinaryIO]
     ) -> Tuple[int, int]:
-        """优化版CSV导入"""
+        """优化版CSV导入
+
+        file_content 可以是文件内容、已落盘文件的路径或二进制流，
+        后两者由 pandas 直接读取，不需要先把整个文件读入内存。
+        """
 
         # 1. 预加载缓存
         self.preload_cache()
 
         # 2. 使用pandas高效读取
-        df = pd.read_csv(BytesIO(file_content), encoding="utf-8", dtype=str)
+        source = BytesIO(file_content) if isinstance(file_content, bytes) else file_content
+        df = pd.read_csv(source, encoding="utf-8", dtype=str)
+
+        # 3. 列运算收集各表数据
+        frames = self._collect_frames(df)
+
+        # 4. 批量插入
+        success_count = self._batch_insert_all(frames, batch_id)
+
+        return success_count, 0
 
-        # 3. 批量收集数据
-        new_stocks = []
-        new_concepts = []
-        stock_concept_mappings = []
-        new_industries = []
-        stock_industry_mappings = []
-        raw_mappings = []
+    def _collect_frames(self, df: pd.DataFrame) -> CSVImportFrames:
+        """整列处理：清洗、去重、与预加载缓存做反连接，得到各表待写入的数据"""
 
         # 检测列名
-        stock_code_col = self._find_column(
-            df.columns.tolist(),
-            ["股票代码", "code", "stock_code", "代码"]
-        )
-        stock_name_col = self._find_column(
-            df.columns.tolist(),
-            ["股票名称", "name", "stock_name", "名称"]
-        )
-        concept_col = self._find_column(
-            df.columns.tolist(),
-            ["概念", "concept", "板块", "concept_name"]
-        )
-        industry_col = self._find_column(
-            df.columns.tolist(),
-            ["行业", "industry", "industry_name"]
+        columns = df.columns.tolist()
+        stock_code_col = self._find_column(columns, ["股票代码", "code", "stock_code", "代码"])
+        stock_name_col = self._find_column(columns, ["股票名称", "name", "stock_name", "名称"])
+        concept_col = self._find_column(columns, ["概念", "concept", "板块", "concept_name"])
+        industry_col = self._find_column(columns, ["行业", "industry", "industry_name"])
+
+        def column_text(col: Optional[str]) -> pd.Series:
+            """等价于逐行 str(value).strip()；空串视为缺失（None）"""
+            if not col:
+                return pd.Series(None, index=df.index, dtype=object)
+            values = df[col].astype(str).str.strip()
+            return values.where(values != "", None)
+
+        stock_codes = df[stock_code_col].astype(str).str.strip()
+        industry_names = column_text(industry_col)
+        industry_names = industry_names.where(~industry_names.isin(["None", "nan"]), None)
+
+        rows = pd.DataFrame({
+            'stock_code': stock_codes,
+            'stock_name': column_text(stock_name_col),
+            'concept_name': column_text(concept_col),
+            'industry_name': industry_names,
+            'source_row_number': np.arange(1, len(df) + 1, dtype=np.int64),
+        })
+        rows = rows[(stock_codes != "") & (stock_codes != "nan")]
+
+        # 新股票：每个代码取首次出现的名称
+        first_rows = rows.drop_duplicates('stock_code')
+        stocks = first_rows.loc[~first_rows['stock_code'].isin(self.stock_cache), ['stock_code', 'stock_name']]
+        self.stock_cache.update(stocks['stock_code'])
+
+        has_concept = rows['concept_name'].notna()
+        has_industry = rows['industry_name'].notna()
+
+        concept_names = pd.unique(rows.loc[has_concept, 'concept_name'])
+        industry_names = pd.unique(rows.loc[has_industry, 'industry_name'])
+
+        return CSVImportFrames(
+            stocks=stocks.reset_index(drop=True),
+            concepts=pd.DataFrame({
+                'concept_name': [c for c in concept_names if c not in self.concept_cache]
+            }),
+            industries=pd.DataFrame({
+                'industry_name': [i for i in industry_names if i not in self.industry_cache]
+            }),
+            stock_concepts=rows.loc[has_concept, ['stock_code', 'concept_name']].reset_index(drop=True),
+            stock_industries=rows.loc[has_industry, ['stock_code', 'industry_name']].reset_index(drop=True),
+            raw=rows.reset_index(drop=True),
         )
 
-        # 4. 处理数据
-        for row_idx, (_, row) in enumerate(df.iterrows(), 1):
-            stock_code = str(row[stock_code_col]).strip()
-            if not stock_code or stock_code == "nan":
-                continue
-
-            stock_name = str(row[stock_name_col]).strip() if stock_name_col else None
-            concept_name = str(row[concept_col]).strip() if concept_col else None
-            industry_name = str(row[industry_col]).strip() if industry_col else None
-
-            # 清理行业名称（处理None、nan等）
-            if not industry_name or industry_name == "None" or industry_name == "nan":
-                industry_name = None
-
-            # 收集新股票
-            if stock_code not in self.stock_cache:
-                new_stocks.append({
-                    'code': stock_code,
-                    'name': stock_name
-                })
-                self.stock_cache.add(stock_code)
-
-            # 收集新概念
-            if concept_name and concept_name not in self.concept_cache:
-                new_concepts.append(concept_name)
-
-            # 收集新行业
-            if industry_name and industry_name not in self.industry_cache:
-                new_industries.append(industry_name)
-
-            # 收集映射关系
-            if concept_name:
-                stock_concept_mappings.append({
-                    'stock_code': stock_code,
-                    'concept_name': concept_name
-                })
-
-            # 收集行业映射
-            if industry_name:
-                stock_industry_mappings.append({
-                    'stock_code': stock_code,
-                    'industry_name': industry_name
-                })
-
-            # 收集原始数据（审计用）
-            raw_mappings.append({
-                'stock_code': stock_code,
-                'stock_name': stock_name,
-                'concept_name': concept_name,
-                'industry_name': industry_name,
-                'source_row_number': row_idx
-            })
-
-        # 5. 批量插入
-        success_count = self._batch_insert_all(
-            new_stocks,
-            new_concepts,
-            stock_concept_mappings,
-            new_industries,
-            stock_industry_mappings,
-            raw_mappings,
-            batch_id
-        )
+    @staticmethod
+    def _resolve_ids(names: pd.Series, cache: Dict[str, int]) -> pd.Series:
+        """名称列→ID列：factorize 后每个不同名称只查一次缓存，无法解析的为空"""
+        codes, uniques = pd.factorize(names)
+        ids = pd.array([cache.get(name) for name in uniques], dtype='Int64')
+        return pd.Series(ids.take(codes), index=names.index)
 
-        return success_count, 0
+    @staticmethod
+    def _nullable_ints(ids: pd.Series) -> List[Optional[int]]:
+        """可空整数列→Python值列表，缺失为 None"""
+        return [None if pd.isna(v) else int(v) for v in ids]
 
-    def _batch_insert_all(
-        self,
-        new_stocks: List[Dict],
-        new_concepts: List[str],
-        mappings: List[Dict],
-        new_industries: List[str],
-        stock_industry_mappings: List[Dict],
-        raw_mappings: List[Dict],
-        batch_id: int
-    ) -> int:
+    def _batch_insert_all(self, frames: CSVImportFrames, batch_id: int) -> int:
         """批量插入所有数据"""
 
-        # 1. 批量插入新股票（使用COPY）
-        if new_stocks:
-            self._bulk_copy_stocks(new_stocks)
+        # 1. 批量写入新股票
+        if len(frames.stocks):
+            self._bulk_copy_stocks(frames.stocks)
 
         # 2. 批量插入新概念
+        new_concepts = frames.concepts['concept_name'].tolist()
         if new_concepts:
             self._bulk_insert_concepts(new_concepts)
             # 更新概念缓存
             self._refresh_concept_cache(new_concepts)
 
         # 3. 批量插入新行业（新增）
+        new_industries = frames.industries['industry_name'].tolist()
         if new_industries:
             self._bulk_insert_industries(new_industries)
             # 更新行业缓存
             self._refresh_industry_cache(new_industries)
 
-        # 4. 批量更新股票-概念映射（先删除再插入，确保数据最新）
-        if mappings:
-            self._bulk_update_mappings(mappings)
+        # 4. 批量同步股票-概念映射（涉及股票的关系以本文件为准）
+        mappings = frames.stock_concepts.assign(
+            concept_id=self._resolve_ids(frames.stock_concepts['concept_name'], self.concept_cache)
+        )
+        if len(mappings):
+            self.membership_changes = self._bulk_update_mappings(mappings)
 
         # 5. 批量插入股票-行业映射（新增）
-        if stock_industry_mappings:
-            self._bulk_insert_industry_mappings(stock_industry_mappings)
+        industry_mappings = frames.stock_industries.assign(
+            industry_id=self._resolve_ids(frames.stock_industries['industry_name'], self.industry_cache)
+        )
+        if len(industry_mappings):
+            self._bulk_insert_industry_mappings(industry_mappings)
 
         # 6. 批量插入原始数据（可选审计）
-        if raw_mappings:
-            self._bulk_insert_raw_mappings(raw_mappings, batch_id)
+        if len(frames.raw):
+            self._bulk_insert_raw_mappings(frames.raw, batch_id)
 
         # 7. 记录导入历史
-        self._record_import_history(batch_id, mappings)
+        self._record_import_history(batch_id, len(mappings))
 
         self.db.commit()
         return len(mappings)
 
-    def _bulk_copy_stocks(self, stocks: List[Dict]):
-        """批量插入股票（使用INSERT...ON CONFLICT）"""
-        if not stocks:
+    def _loader(self) -> BulkLoader:
+        """基于当前会话连接的批量写入器（与 self.db 处于同一事务）"""
+        return BulkLoader(self.db.connection().connection.cursor())
+
+    def _bulk_copy_stocks(self, stocks: pd.DataFrame):
+        """批量写入股票：COPY到暂存表后合并，已存在的只补全名称"""
+        if not len(stocks):
             return
 
-        # 使用INSERT...ON CONFLICT（COPY不支持冲突处理）
-        values = []
-        for stock in stocks:
-            code = stock['code'].replace("'", "''")
-            name = stock['name'].replace("'", "''") if stock['name'] else None
-            if name:
-                values.append(f"('{code}', '{name}')")
-            else:
-                values.append(f"('{code}', NULL)")
-
-        # 分批插入避免SQL过长
-        batch_size = 1000
-        for i in range(0, len(values), batch_size):
-            batch = values[i:i + batch_size]
-            sql = text(f"""
-                INSERT INTO stocks (stock_code, stock_name)
-                VALUES {','.join(batch)}
-                ON CONFLICT (stock_code) DO UPDATE
-                SET stock_name = COALESCE(EXCLUDED.stock_name, stocks.stock_name)
-            """)
-            self.db.execute(sql)
+        self._loader().upsert(
+            'stocks',
+            ('stock_code', 'stock_name'),
+            pgcopy.ColumnBatch([
+                _text_column(stocks['stock_code']),
+                _text_column(stocks['stock_name']),
+            ], len(stocks)),
+            conflict_columns=('stock_code',),
+            update_columns={'stock_name': 'COALESCE(EXCLUDED.stock_name, stocks.stock_name)'}
+        )
 
     def _bulk_insert_concepts(self, concepts: List[str]):
         """批量插入概念"""
         if not concepts:
             return
 
-        # 使用VALUES子句批量插入
-        values = ", ".join([f"('{c}')" for c in concepts])
-        sql = text(f"""
-            INSERT INTO concepts (concept_name)
-            VALUES {values}
-            ON CONFLICT (concept_name) DO NOTHING
+        self._loader().upsert(
+            'concepts',
+            ('concept_name',),
+            pgcopy.ColumnBatch([pgcopy.text(concepts, np.arange(len(concepts)))], len(concepts)),
+            conflict_columns=('concept_name',)
+        )
+
+    def _bulk_update_mappings(self, mappings: pd.DataFrame) -> MembershipChanges:
+        """批量更新股票-概念映射关系（mappings 含 stock_code, concept_id 列）
+
+        Returns:
+            涉及股票的 新增/移除 (concept_id, stock_code) 关系，供增量重算使用
+        """
+        loader = self._loader()
+        stage = loader.staging_table('stock_concepts')
+
+        # 概念无法解析的行也写入暂存表（concept_id 为空），该股票的旧关系同样会被移除
+        loader.stage(
+            'stock_concepts',
+            ('stock_code', 'concept_id'),
+            zip(mappings['stock_code'], self._nullable_ints(mappings['concept_id']))
+        )
+        loader.cursor.execute(f"ANALYZE {stage}")
+
+        if self.mapping_sync == "replace":
+            return self._replace_mappings(loader.cursor, stage)
+        return self._sync_mappings(loader.cursor, stage)
+
+    def _sync_mappings(self, cursor, stage: str) -> MembershipChanges:
+        """差异同步：只删除消失的关系、插入新增的关系
+
+        未变化的行不动，避免整表改写带来的膨胀和长时间锁定。
+        """
+
+        # 1. 删除涉及股票在文件中已不存在的关系
+        cursor.execute(f"""
+            DELETE FROM stock_concepts sc
+            WHERE sc.stock_code IN (SELECT stock_code FROM {stage})
+              AND NOT EXISTS (
+                  SELECT 1 FROM {stage} s
+                  WHERE s.stock_code = sc.stock_code AND s.concept_id = sc.concept_id
+              )
+            RETURNING sc.concept_id, sc.stock_code
+        """)
+        removed = set(cursor.fetchall())
+
+        # 2. 插入新增的关系（已存在的由唯一约束跳过）
+        cursor.execute(f"""
+            INSERT INTO stock_concepts (stock_code, concept_id)
+            SELECT DISTINCT stock_code, concept_id
+            FROM {stage}
+            WHERE concept_id IS NOT NULL
+            ON CONFLICT (stock_code, concept_id) DO NOTHING
+            RETURNING concept_id, stock_code
+        """)
+        added = set(cursor.fetchall())
+
+        return MembershipChanges(added=added, removed=removed)
+
+    def _replace_mappings(self, cursor, stage: str) -> MembershipChanges:
+        """全量替换：删除涉及股票的旧关系后重新插入"""
+
+        # 1. 删除这些股票的旧映射，同时取回旧关系
+        cursor.execute(f"""
+            DELETE FROM stock_concepts
+            WHERE stock_code IN (SELECT stock_code FROM {stage})
+            RETURNING concept_id, stock_code
+        """)
+        old_pairs = set(cursor.fetchall())
+
+        # 2. 插入新映射关系
+        cursor.execute(f"""
+            INSERT INTO stock_concepts (stock_code, concept_id)
+            SELECT DISTINCT stock_code, concept_id
+            FROM {stage}
+            WHERE concept_id IS NOT NULL
+            ON CONFLICT (stock_code, concept_id) DO NOTHING
+            RETURNING concept_id, stock_code
         """)
-        self.db.execute(sql)
-
-    def _bulk_update_mappings(self, mappings: List[Dict]):
-        """批量更新股票-概念映射关系"""
-
-        # 1. 收集所有涉及的股票
-        stock_codes = list(set(m['stock_code'] for m in mappings))
-
-        # 2. 删除这些股票的旧映射（全量更新策略）
-        if stock_codes:
-            placeholders = ','.join([f"'{code}'" for code in stock_codes])
-            self.db.execute(text(f"""
-                DELETE FROM stock_concepts
-                WHERE stock_code IN ({placeholders})
-            """))
-
-        # 3. 批量插入新映射关系
-        values_list = []
-        for mapping in mappings:
-            concept_id = self.concept_cache.get(mapping['concept_name'])
-            if concept_id:
-                values_list.append(
-                    f"('{mapping['stock_code']}', {concept_id})"
-                )
-
-        if values_list:
-            # 分批插入避免SQL过长
-            batch_size = 5000
-            for i in range(0, len(values_list), batch_size):
-                batch = values_list[i:i + batch_size]
-                sql = text(f"""
-                    INSERT INTO stock_concepts (stock_code, concept_id)
-                    VALUES {','.join(batch)}
-                    ON CONFLICT (stock_code, concept_id) DO NOTHING
-                """)
-                self.db.execute(sql)
+        new_pairs = set(cursor.fetchall())
+
+        return MembershipChanges.diff(old_pairs, new_pairs)
 
     def _refresh_concept_cache(self, new_concepts: List[str]):
         """刷新概念缓存"""
         if not new_concepts:
             return
 
-        placeholders = ','.join([f"'{c}'" for c in new_concepts])
-        result = self.db.execute(text(f"""
+        result = self.db.execute(text("""
             SELECT id, concept_name FROM concepts
-            WHERE concept_name IN ({placeholders})
-        """)).fetchall()
+            WHERE concept_name = ANY(:names)
+        """), {'names': list(new_concepts)}).fetchall()
 
         for r in result:
             self.concept_cache[r.concept_name] = r.id
@@ -282,113 +332,66 @@ class OptimizedCSVImportService:
         if not industries:
             return
 
-        # 使用VALUES子句批量插入
-        unique_industries = list(set(industries))  # 去重
-        values = []
-        for ind in unique_industries:
-            escaped_ind = ind.replace("'", "''")
-            values.append(f"('{escaped_ind}', 1)")
-
-        values_str = ", ".join(values)
-        sql = text(f"""
-            INSERT INTO industries (industry_name, level)
-            VALUES {values_str}
-            ON CONFLICT (industry_name) DO NOTHING
-        """)
-        self.db.execute(sql)
+        unique_industries = list(dict.fromkeys(industries))  # 去重
+        self._loader().upsert(
+            'industries',
+            ('industry_name', 'level'),
+            pgcopy.ColumnBatch([
+                pgcopy.text(unique_industries, np.arange(len(unique_industries))),
+                pgcopy.int4(1),
+            ], len(unique_industries)),
+            conflict_columns=('industry_name',)
+        )
 
     def _refresh_industry_cache(self, new_industries: List[str]):
         """刷新行业缓存"""
         if not new_industries:
             return
 
-        unique_industries = list(set(new_industries))
-        placeholders = []
-        for ind in unique_industries:
-            escaped_ind = ind.replace("'", "''")
-            placeholders.append(f"'{escaped_ind}'")
-
-        placeholders_str = ','.join(placeholders)
-        result = self.db.execute(text(f"""
+        result = self.db.execute(text("""
             SELECT id, industry_name FROM industries
-            WHERE industry_name IN ({placeholders_str})
-        """)).fetchall()
+            WHERE industry_name = ANY(:names)
+        """), {'names': list(set(new_industries))}).fetchall()
 
         for r in result:
             self.industry_cache[r.industry_name] = r.id
 
-    def _bulk_insert_industry_mappings(self, mappings: List[Dict]):
-        """批量插入股票-行业映射"""
-        if not mappings:
+    def _bulk_insert_industry_mappings(self, mappings: pd.DataFrame):
+        """批量插入股票-行业映射（mappings 含 stock_code, industry_id 列）"""
+        mappings = mappings[mappings['industry_id'].notna()]
+        if not len(mappings):
             return
 
-        # 分批插入避免SQL过长
-        batch_size = 5000
-        values_list = []
-
-        for mapping in mappings:
-            industry_id = self.industry_cache.get(mapping['industry_name'])
-            if industry_id:
-                values_list.append(
-                    f"('{mapping['stock_code']}', {industry_id})"
-                )
-
-        if values_list:
-            for i in range(0, len(values_list), batch_size):
-                batch = values_list[i:i + batch_size]
-                sql = text(f"""
-                    INSERT INTO stock_industries (stock_code, industry_id)
-                    VALUES {','.join(batch)}
-                    ON CONFLICT (stock_code, industry_id) DO NOTHING
-                """)
-                self.db.execute(sql)
-
-    def _bulk_insert_raw_mappings(self, mappings: List[Dict], batch_id: int):
-        """批量插入原始映射数据（审计用）"""
-        if not mappings:
+        self._loader().upsert(
+            'stock_industries',
+            ('stock_code', 'industry_id'),
+            pgcopy.ColumnBatch([
+                _text_column(mappings['stock_code']),
+                pgcopy.int4(mappings['industry_id'].to_numpy(dtype=np.int32)),
+            ], len(mappings)),
+            conflict_columns=('stock_code', 'industry_id')
+        )
+
+    def _bulk_insert_raw_mappings(self, mappings: pd.DataFrame, batch_id: int):
+        """批量写入原始映射数据（审计用）
+
+        审计表没有唯一约束，直接二进制COPY，不经暂存表。
+        """
+        if not len(mappings):
             return
 
-        # 分批插入避免SQL过长
-        batch_size = 1000
-
-        for batch_idx in range(0, len(mappings), batch_size):
-            batch_records = mappings[batch_idx:batch_idx + batch_size]
-            values = []
-
-            for m in batch_records:
-                stock_code = m['stock_code'].replace("'", "''")
-                stock_name_val = m['stock_name'].replace("'", "''") if m['stock_name'] else None
-                concept_name_val = m['concept_name'].replace("'", "''") if m['concept_name'] else None
-                industry_name_val = m['industry_name'].replace("'", "''") if m['industry_name'] else None
-
-                stock_name = f"'{stock_name_val}'" if stock_name_val else "NULL"
-                concept_name = f"'{concept_name_val}'" if concept_name_val else "NULL"
-                industry_name = f"'{industry_name_val}'" if industry_name_val else "NULL"
-
-                values.append(f"""(
-                    {batch_id},
-                    '{stock_code}',
-                    {stock_name},
-                    {concept_name},
-                    {industry_name},
-                    NULL,
-                    {m['source_row_number']},
-                    true,
-                    NULL
-                )""")
-
-            insert_sql = f"""
-                INSERT INTO stock_concept_mapping_raw (
-                    import_batch_id, stock_code, stock_name, concept_name,
-                    industry_name, extra_fields, source_row_number, is_valid,
-                    validation_errors
-                )
-                VALUES {','.join(values)}
-                ON CONFLICT DO NOTHING
-            """
-            self.db.execute(text(insert_sql))
-
-    def _record_import_history(self, batch_id: int, mappings: List[Dict]):
+        cursor = self.db.connection().connection.cursor()
+        pgcopy.copy_binary(cursor, 'stock_concept_mapping_raw', RAW_MAPPING_COLUMNS, pgcopy.ColumnBatch([
+            pgcopy.int4(batch_id),
+            _text_column(mappings['stock_code']),
+            _text_column(mappings['stock_name']),
+            _text_column(mappings['concept_name']),
+            _text_column(mappings['industry_name']),
+            pgcopy.int4(mappings['source_row_number'].to_numpy(dtype=np.int32)),
+            pgcopy.boolean(True),  # is_valid
+        ], len(mappings)))
+
+    def _record_import_history(self, batch_id: int, mapping_count: int):
         """记录导入历史用于审计"""
         # 可以记录本次导入更新了哪些映射关系
         sql = text("""
@@ -401,7 +404,7 @@ class OptimizedCSVImportService:
         """)
         self.db.execute(sql, {
             'batch_id': batch_id,
-            'count': len(mappings)
+            'count': mapping_count
         })
 
     def _find_column(self, columns: list, candidates: list) -> str:
@@ -1,17 +1,50 @@
 """优化的TXT导入服务 - 股票交易数据导入与计算"""
-from typing import Dict, Set, List, Tuple, Optional
+from typing import Dict, Set, List, Tuple, Optional, Iterator, BinaryIO, Sequence
 from datetime import date, datetime
 from dataclasses import dataclass
-from collections import defaultdict
+from array import array
+from itertools import chain
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 import concurrent.futures
-from io import StringIO
+from io import BytesIO
 import csv
 import logging
 
+import numpy as np
+import pandas as pd
+
+from app.services.membership_index import ConceptMembershipIndex, ConceptRanking
+from app.services import pg_binary_copy as pgcopy
+from app.services.bulk_loader import BulkLoader
+from app.services.pipeline import StagePipeline
+
 logger = logging.getLogger(__name__)
 
+# 流式解析参数：每次读取的字节块大小、每批产出的记录数
+STREAM_CHUNK_SIZE = 1024 * 1024
+STREAM_BATCH_SIZE = 50000
+
+# 流水线模式参数：每个字节块大小、阶段间队列深度
+PIPELINE_CHUNK_SIZE = 8 * 1024 * 1024
+PIPELINE_QUEUE_DEPTH = 4
+
+# 原始/排名/汇总表的写入列（顺序即COPY列顺序）
+RAW_COLUMNS = (
+    'import_batch_id', 'metric_type_id', 'metric_code',
+    'stock_code_raw', 'stock_code', 'exchange_prefix',
+    'trade_date', 'trade_value', 'source_row_number', 'is_valid'
+)
+RANK_COLUMNS = (
+    'metric_type_id', 'metric_code', 'concept_id', 'stock_code',
+    'trade_date', 'trade_value', 'rank', 'import_batch_id'
+)
+SUMMARY_COLUMNS = (
+    'metric_type_id', 'metric_code', 'concept_id', 'trade_date',
+    'total_value', 'avg_value', 'max_value', 'min_value',
+    'median_value', 'import_batch_id'
+)
+
 
 @dataclass
 class TradeData:
@@ -22,41 +55,169 @@ class TradeData:
     exchange_prefix: Optional[str] = None
 
 
+@dataclass
+class ColumnarTrades:
+    """列式交易数据：整文件解析为类型化数组，代替逐行的 TradeData 对象
+
+    code_ids 指向 stock_codes / exchange_prefixes（按 (净代码, 前缀) 去重），
+    date_ordinals 为 date.toordinal()。
+    """
+    code_ids: np.ndarray  # int32
+    date_ordinals: np.ndarray  # int32
+    trade_values: np.ndarray  # int64
+    stock_codes: List[str]
+    exchange_prefixes: List[Optional[str]]
+
+    def __len__(self) -> int:
+        return len(self.trade_values)
+
+    def take(self, mask: np.ndarray) -> "ColumnarTrades":
+        """按布尔掩码或下标筛选行，代码表保持共享"""
+        return ColumnarTrades(
+            code_ids=self.code_ids[mask],
+            date_ordinals=self.date_ordinals[mask],
+            trade_values=self.trade_values[mask],
+            stock_codes=self.stock_codes,
+            exchange_prefixes=self.exchange_prefixes,
+        )
+
+    def valid_mask(self, valid_stocks: Set[str]) -> np.ndarray:
+        """有概念关联的行：先按代码表判定，再按 code_ids 整体取值"""
+        valid_by_id = np.fromiter(
+            (code in valid_stocks for code in self.stock_codes),
+            dtype=bool,
+            count=len(self.stock_codes),
+        )
+        return valid_by_id[self.code_ids]
+
+    def to_trades(self) -> List[TradeData]:
+        """转换回 TradeData 列表（用于与逐行路径比对结果）"""
+        return [
+            TradeData(
+                stock_code=self.stock_codes[code_id],
+                trade_date=date.fromordinal(ordinal),
+                trade_value=value,
+                exchange_prefix=self.exchange_prefixes[code_id],
+            )
+            for code_id, ordinal, value in zip(
+                self.code_ids.tolist(), self.date_ordinals.tolist(), self.trade_values.tolist()
+            )
+        ]
+
+    @classmethod
+    def from_trades(cls, trades: List[TradeData]) -> "ColumnarTrades":
+        """由 TradeData 列表构建列式数据"""
+        code_index: Dict[Tuple[str, Optional[str]], int] = {}
+        code_ids = np.empty(len(trades), dtype=np.int32)
+        for i, td in enumerate(trades):
+            code_ids[i] = code_index.setdefault((td.stock_code, td.exchange_prefix), len(code_index))
+
+        return cls(
+            code_ids=code_ids,
+            date_ordinals=np.fromiter((td.trade_date.toordinal() for td in trades), dtype=np.int32, count=len(trades)),
+            trade_values=np.fromiter((td.trade_value for td in trades), dtype=np.int64, count=len(trades)),
+            stock_codes=[code for code, _ in code_index],
+            exchange_prefixes=[prefix for _, prefix in code_index],
+        )
+
+
+@dataclass
+class MappingSnapshot:
+    """股票-概念映射的只读快照
+
+    批量导入时在父进程加载一次，通过 share_mapping_snapshot 安装为进程级共享数据，
+    进程池的工作进程经 fork 继承（或作为 initializer 参数传入），不再逐日期全表查询。
+    signature 用于发现 stock_concepts 在运行中被修改。
+    """
+    signature: Tuple[int, int, int]
+    membership: ConceptMembershipIndex
+    valid_stocks: frozenset
+
+
+# stock_concepts 的内容签名：行数、最大ID、与顺序无关的内容哈希和
+MAPPING_SIGNATURE_SQL = """
+    SELECT COUNT(*),
+           COALESCE(MAX(id), 0),
+           COALESCE(SUM(hashtext(stock_code || ':' || concept_id)), 0)
+    FROM stock_concepts
+"""
+
+_shared_snapshot: Optional[MappingSnapshot] = None
+
+
+def share_mapping_snapshot(snapshot: Optional[MappingSnapshot]):
+    """安装（或清除）本进程共享的映射快照，可直接用作 Pool 的 initializer"""
+    global _shared_snapshot
+    _shared_snapshot = snapshot
+
+
 class OptimizedTXTImportService:
     """优化的TXT导入服务：高效处理交易数据并计算排名"""
 
     def __init__(self, db: Session):
         self.db = db
         # 预加载缓存
-        self.stock_concepts_map: Dict[str, List[int]] = {}  # 股票到概念ID列表的映射
-        self.valid_stocks: Set[str] = set()  # 有概念关联的股票集合
-        self.concept_stocks_map: Dict[int, Set[str]] = defaultdict(set)  # 概念到股票集合的映射
+        self.valid_stocks: Set[str] = frozenset()  # 有概念关联的股票集合
+        self.membership = ConceptMembershipIndex.from_mapping({})  # 股票→概念的CSR索引
 
-    def preload_mappings(self):
-        """预加载股票-概念映射关系，避免重复查询"""
-        # 加载所有股票-概念映射
-        mappings = self.db.execute(text("""
-            SELECT sc.stock_code, sc.concept_id, c.concept_name
+    @classmethod
+    def mapping_signature(cls, db: Session) -> Tuple[int, int, int]:
+        """stock_concepts 当前的内容签名"""
+        return tuple(db.execute(text(MAPPING_SIGNATURE_SQL)).fetchone())
+
+    @classmethod
+    def load_mapping_snapshot(cls, db: Session) -> MappingSnapshot:
+        """全量加载股票-概念映射并编译为CSR索引
+
+        先取签名再加载：两步之间若有修改，签名偏旧，下次校验时会重新加载。
+        """
+        signature = cls.mapping_signature(db)
+
+        mappings = db.execute(text("""
+            SELECT sc.stock_code, sc.concept_id
             FROM stock_concepts sc
             JOIN concepts c ON c.id = sc.concept_id
         """)).fetchall()
 
-        for mapping in mappings:
-            stock_code = mapping.stock_code
-            concept_id = mapping.concept_id
+        membership = ConceptMembershipIndex.from_pairs(
+            (mapping.stock_code, mapping.concept_id) for mapping in mappings
+        )
+        return MappingSnapshot(
+            signature=signature,
+            membership=membership,
+            valid_stocks=frozenset(membership.stock_codes),
+        )
 
-            # 股票到概念映射
-            if stock_code not in self.stock_concepts_map:
-                self.stock_concepts_map[stock_code] = []
-            self.stock_concepts_map[stock_code].append(concept_id)
+    def preload_mappings(self):
+        """预加载股票-概念映射关系，避免重复查询
+
+        已安装共享快照且 stock_concepts 未变化时直接复用；
+        已变化则重新加载，并替换本进程的共享快照供后续日期使用。
+        """
+        snapshot = _shared_snapshot
+        if snapshot is not None:
+            if snapshot.signature == self.mapping_signature(self.db):
+                self.use_mapping_snapshot(snapshot)
+                logger.info(f"复用共享映射: {len(self.valid_stocks)}个有效股票")
+                return
+
+            logger.warning("stock_concepts 已变化，共享映射失效，重新加载")
+            snapshot = self.load_mapping_snapshot(self.db)
+            share_mapping_snapshot(snapshot)
+        else:
+            snapshot = self.load_mapping_snapshot(self.db)
 
-            # 概念到股票映射
-            self.concept_stocks_map[concept_id].add(stock_code)
+        self.use_mapping_snapshot(snapshot)
 
-            # 有效股票集合
-            self.valid_stocks.add(stock_code)
+        logger.info(
+            f"预加载完成: {len(self.valid_stocks)}个有效股票, "
+            f"{len(np.unique(self.membership.concept_ids))}个概念"
+        )
 
-        logger.info(f"预加载完成: {len(self.valid_stocks)}个有效股票, {len(self.concept_stocks_map)}个概念")
+    def use_mapping_snapshot(self, snapshot: MappingSnapshot):
+        """直接使用已加载的映射快照（不查询数据库）"""
+        self.membership = snapshot.membership
+        self.valid_stocks = snapshot.valid_stocks
 
     def parse_and_import_with_compute(
         self,
@@ -101,6 +262,245 @@ class OptimizedTXTImportService:
 
         return len(valid_trades), invalid_count
 
+    def parse_and_import_columnar(
+        self,
+        batch_id: int,
+        file_content: bytes,
+        metric_type_id: int,
+        metric_code: str,
+        data_date: date
+    ) -> Tuple[int, int]:
+        """列式解析TXT文件：整列批量解析、过滤、COPY和排名
+
+        与 parse_and_import_with_compute 产出完全相同的数据，
+        但避免了逐行创建 TradeData 对象和逐行的 strptime/int(float()) 调用。
+        """
+        self.preload_mappings()
+
+        trades = self._parse_file_columnar(file_content, data_date)
+
+        valid = trades.take(trades.valid_mask(self.valid_stocks))
+        invalid_count = len(trades) - len(valid)
+
+        logger.info(f"列式解析完成: 总计{len(trades)}条, 有效{len(valid)}条")
+
+        if len(valid):
+            self._delete_raw_data(metric_type_id, date.fromordinal(int(valid.date_ordinals[0])))
+            self._copy_raw_columns(valid, batch_id, metric_type_id, metric_code)
+            logger.info(f"导入原始数据: {len(valid)}条完成")
+
+        # 代码表级别映射到索引下标，再按 code_ids 整体取值
+        stock_idx = self.membership.lookup(valid.stock_codes)[valid.code_ids]
+        self._compute_rankings_indexed(
+            stock_idx,
+            valid.trade_values,
+            batch_id,
+            metric_type_id,
+            metric_code,
+            data_date
+        )
+
+        self.db.commit()
+
+        return len(valid), invalid_count
+
+    def parse_and_import_streaming(
+        self,
+        batch_id: int,
+        stream: BinaryIO,
+        metric_type_id: int,
+        metric_code: str,
+        data_date: date,
+        batch_size: int = STREAM_BATCH_SIZE
+    ) -> Tuple[int, int]:
+        """流式解析TXT文件，边解析边过滤边COPY，内存占用只与批次大小有关
+
+        与 parse_and_import_with_compute 结果一致。排名需要整天的数据，
+        因此只保留有效记录的 (股票代码, 交易值) 紧凑数组用于最后的排名计算。
+        """
+        self.preload_mappings()
+
+        total_count = 0
+        valid_count = 0
+        row_offset = 0
+        raw_cleared = False
+
+        # 排名输入：股票代码（复用同一字符串对象）+ int64 交易值
+        code_pool: Dict[str, str] = {}
+        rank_codes: List[str] = []
+        rank_values = array('q')
+
+        for trade_batch in self.iter_trade_batches(stream, data_date, batch_size):
+            total_count += len(trade_batch)
+
+            valid_trades = [
+                td for td in trade_batch
+                if td.stock_code in self.valid_stocks
+            ]
+            if not valid_trades:
+                continue
+
+            # 首个有效批次到达时清理旧原始数据（与整文件模式相同，按首条记录日期）
+            if not raw_cleared:
+                self._delete_raw_data(metric_type_id, valid_trades[0].trade_date)
+                raw_cleared = True
+
+            self._copy_raw_rows(valid_trades, batch_id, metric_type_id, metric_code, row_offset)
+            row_offset += len(valid_trades)
+            valid_count += len(valid_trades)
+
+            for td in valid_trades:
+                rank_codes.append(code_pool.setdefault(td.stock_code, td.stock_code))
+                rank_values.append(td.trade_value)
+
+        logger.info(f"流式解析完成: 总计{total_count}条, 有效{valid_count}条")
+
+        self._compute_rankings_from_values(
+            rank_codes,
+            rank_values,
+            batch_id,
+            metric_type_id,
+            metric_code,
+            data_date
+        )
+
+        self.db.commit()
+
+        return valid_count, total_count - valid_count
+
+    def parse_and_import_pipelined(
+        self,
+        batch_id: int,
+        stream: BinaryIO,
+        metric_type_id: int,
+        metric_code: str,
+        data_date: date,
+        chunk_size: int = PIPELINE_CHUNK_SIZE,
+        queue_depth: int = PIPELINE_QUEUE_DEPTH
+    ) -> Tuple[int, int]:
+        """流水线导入：读取/解析、过滤、COPY 三个阶段在不同线程上重叠执行
+
+        各阶段之间是有界队列，慢阶段对上游形成背压，内存只与块大小和队列深度有关。
+        所有块通过一次二进制COPY写入原始数据表，排名输入在COPY的同时按块收集，
+        总耗时接近最慢阶段而不是各阶段之和。结果与 parse_and_import_streaming 一致。
+        """
+        self.preload_mappings()
+
+        valid_stocks = self.valid_stocks
+        membership = self.membership
+        counts = {'total': 0, 'valid': 0}
+
+        def parse_block(block: bytes) -> ColumnarTrades:
+            return self._parse_file_columnar(block, data_date)
+
+        def filter_block(trades: ColumnarTrades) -> Optional[Tuple[ColumnarTrades, np.ndarray]]:
+            counts['total'] += len(trades)
+            valid = trades.take(trades.valid_mask(valid_stocks))
+            if not len(valid):
+                return None
+            return valid, membership.lookup(valid.stock_codes)[valid.code_ids]
+
+        rank_idx: List[np.ndarray] = []
+        rank_values: List[np.ndarray] = []
+
+        with StagePipeline(
+            self.iter_line_blocks(stream, chunk_size),
+            [parse_block, filter_block],
+            queue_depth=queue_depth,
+            name=f"txt-import-{batch_id}"
+        ) as pipeline:
+            blocks = iter(pipeline)
+            first = next(blocks, None)
+
+            if first is not None:
+                # 与整文件模式相同，按首条有效记录的日期清理旧原始数据
+                self._delete_raw_data(metric_type_id, date.fromordinal(int(first[0].date_ordinals[0])))
+
+                def raw_batches() -> Iterator[pgcopy.ColumnBatch]:
+                    for valid, stock_idx in chain([first], blocks):
+                        rank_idx.append(stock_idx)
+                        rank_values.append(valid.trade_values)
+                        yield self._raw_column_batch(
+                            valid, batch_id, metric_type_id, metric_code, counts['valid']
+                        )
+                        counts['valid'] += len(valid)
+
+                cursor = self.db.connection().connection.cursor()
+                pgcopy.copy_binary_batches(cursor, 'stock_metric_data_raw', RAW_COLUMNS, raw_batches())
+
+        logger.info(f"流水线解析完成: 总计{counts['total']}条, 有效{counts['valid']}条")
+
+        self._compute_rankings_indexed(
+            np.concatenate(rank_idx) if rank_idx else np.empty(0, dtype=np.int32),
+            np.concatenate(rank_values) if rank_values else np.empty(0, dtype=np.int64),
+            batch_id,
+            metric_type_id,
+            metric_code,
+            data_date
+        )
+
+        self.db.commit()
+
+        return counts['valid'], counts['total'] - counts['valid']
+
+    def iter_trade_batches(
+        self,
+        stream: BinaryIO,
+        default_date: date,
+        batch_size: int = STREAM_BATCH_SIZE,
+        chunk_size: int = STREAM_CHUNK_SIZE
+    ) -> Iterator[List[TradeData]]:
+        """按字节块读取文件流，按固定批次产出解析后的交易数据"""
+        batch: List[TradeData] = []
+
+        for block in self.iter_line_blocks(stream, chunk_size):
+            for td in self._parse_block(block, default_date):
+                batch.append(td)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+
+        if batch:
+            yield batch
+
+    @staticmethod
+    def iter_line_blocks(stream: BinaryIO, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        """按字节块读取文件流，产出由完整行组成的字节块
+
+        字节块只在换行符处切分，保证多字节字符不会被截断。
+        """
+        tail = b''
+
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+
+            block = tail + chunk
+            cut = block.rfind(b'\n')
+            if cut < 0:
+                tail = block
+                continue
+            tail = block[cut + 1:]
+
+            yield block[:cut + 1]
+
+        if tail:
+            yield tail
+
+    def _parse_block(self, block: bytes, default_date: date) -> Iterator[TradeData]:
+        """解析一段完整行组成的字节块"""
+        # 尝试不同编码
+        try:
+            content = block.decode('utf-8')
+        except UnicodeDecodeError:
+            content = block.decode('gbk')
+
+        for line in content.split('\n'):
+            td = self._parse_line(line, default_date)
+            if td is not None:
+                yield td
+
     def _parse_file_content(self, file_content: bytes, default_date: date) -> List[TradeData]:
         """解析文件内容为交易数据列表"""
         # 尝试不同编码
@@ -112,41 +512,102 @@ class OptimizedTXTImportService:
         trade_data_list = []
         lines = content.strip().split('\n')
 
-        for line_num, line in enumerate(lines, 1):
-            line = line.strip()
-            if not line:
-                continue
+        for line in lines:
+            td = self._parse_line(line, default_date)
+            if td is not None:
+                trade_data_list.append(td)
 
-            # 解析行数据（制表符或空格分隔）
-            parts = line.split('\t') if '\t' in line else line.split()
-            if len(parts) < 3:
-                continue
+        return trade_data_list
 
-            # 解析字段
-            stock_code_raw = parts[0].strip()
-            trade_date_str = parts[1].strip()
-            trade_value_str = parts[2].strip()
+    def _parse_file_columnar(self, file_content: bytes, default_date: date) -> ColumnarTrades:
+        """批量解析制表符分隔文件为列式数组
+
+        代码和日期先去重（factorize），只对去重后的少量取值做清洗和日期解析；
+        交易值整列转换。出现非制表符分隔的行时退回逐行解析，保证结果一致。
+        """
+        read_options = dict(
+            sep='\t',
+            header=None,
+            usecols=[0, 1, 2],
+            dtype=str,
+            na_filter=False,
+            quoting=csv.QUOTE_NONE,
+            skip_blank_lines=True,
+        )
+        try:
+            df = pd.read_csv(BytesIO(file_content), encoding='utf-8', **read_options)
+        except UnicodeDecodeError:
+            df = pd.read_csv(BytesIO(file_content), encoding='gbk', **read_options)
+        except (pd.errors.EmptyDataError, ValueError):
+            # 空文件或不足三列
+            return ColumnarTrades.from_trades(self._parse_file_content(file_content, default_date))
+
+        # 股票代码：去重后逐个清洗
+        raw_code_ids, raw_codes = pd.factorize(df[0], sort=False)
+        stripped = [c.strip() for c in raw_codes]
+        if any(not c or any(ch.isspace() for ch in c) for c in stripped):
+            # 空格分隔行或行首空白导致列错位
+            return ColumnarTrades.from_trades(self._parse_file_content(file_content, default_date))
+
+        code_index: Dict[Tuple[str, Optional[str]], int] = {}
+        raw_to_code = np.empty(len(raw_codes), dtype=np.int32)
+        for i, raw_code in enumerate(stripped):
+            raw_to_code[i] = code_index.setdefault(self._parse_stock_code(raw_code), len(code_index))
+
+        # 交易日期：去重后逐个解析
+        raw_date_ids, raw_dates = pd.factorize(df[1], sort=False)
+        raw_to_ordinal = np.fromiter(
+            (self._parse_date(d.strip(), default_date).toordinal() for d in raw_dates),
+            dtype=np.int32,
+            count=len(raw_dates),
+        )
 
-            # 处理股票代码前缀
-            stock_code, exchange_prefix = self._parse_stock_code(stock_code_raw)
+        # 交易值：整列转换，等价于 int(float(x))，无法解析或非有限值的行丢弃
+        values = pd.to_numeric(df[2].str.strip(), errors='coerce').to_numpy(dtype=np.float64)
+        keep = np.isfinite(values)
 
-            # 处理日期
-            trade_date = self._parse_date(trade_date_str, default_date)
+        return ColumnarTrades(
+            code_ids=raw_to_code[raw_code_ids[keep]],
+            date_ordinals=raw_to_ordinal[raw_date_ids[keep]],
+            trade_values=values[keep].astype(np.int64),
+            stock_codes=[code for code, _ in code_index],
+            exchange_prefixes=[prefix for _, prefix in code_index],
+        )
 
-            # 处理交易值
-            try:
-                trade_value = int(float(trade_value_str))
-            except:
-                continue
+    def _parse_line(self, line: str, default_date: date) -> Optional[TradeData]:
+        """解析单行数据，无效行返回None"""
+        line = line.strip()
+        if not line:
+            return None
 
-            trade_data_list.append(TradeData(
-                stock_code=stock_code,
-                trade_date=trade_date,
-                trade_value=trade_value,
-                exchange_prefix=exchange_prefix
-            ))
+        # 解析行数据（制表符或空格分隔）
+        parts = line.split('\t') if '\t' in line else line.split()
+        if len(parts) < 3:
+            return None
 
-        return trade_data_list
+        # 解析字段
+        stock_code_raw = parts[0].strip()
+        trade_date_str = parts[1].strip()
+        trade_value_str = parts[2].strip()
+
+        # 处理股票代码前缀
+        stock_code, exchange_prefix = self._parse_stock_code(stock_code_raw)
+
+        # 处理日期
+        trade_date = self._parse_date(trade_date_str, default_date)
+
+        # 处理交易值
+        try:
+            trade_value = int(float(trade_value_str))
+        except:
+            return None
+
+        return TradeData(
+            stock_code=stock_code,
+            trade_date=trade_date,
+            trade_value=trade_value,
+            exchange_prefix=exchange_prefix
+        )
 
     def _parse_stock_code(self, raw_code: str) -> Tuple[str, Optional[str]]:
         """解析股票代码，分离前缀"""
@@ -183,14 +644,19 @@ class OptimizedTXTImportService:
         if not trade_data_list:
             return
 
-        # 获取数据日期（从第一条数据）
-        trade_date = trade_data_list[0].trade_date
+        # 第1步：删除该日期该指标的旧原始数据（按第一条数据的日期）
+        self._delete_raw_data(metric_type_id, trade_data_list[0].trade_date)
 
-        # 获取原生连接和游标
+        # 第2步：COPY导入
+        self._copy_raw_rows(trade_data_list, batch_id, metric_type_id, metric_code)
+
+        logger.info(f"导入原始数据: {len(trade_data_list)}条完成")
+
+    def _delete_raw_data(self, metric_type_id: int, trade_date: date):
+        """删除该日期该指标的旧原始数据"""
         conn = self.db.connection().connection
         cursor = conn.cursor()
 
-        # 第1步：删除该日期该指标的旧原始数据
         cursor.execute("""
             DELETE FROM stock_metric_data_raw
             WHERE metric_type_id = %s AND trade_date = %s
@@ -202,40 +668,68 @@ class OptimizedTXTImportService:
         # 关键：提交删除操作，确保后续COPY能看到最新状态
         conn.commit()
 
-        # 第2步：准备COPY数据
-        output = StringIO()
-        writer = csv.writer(output, delimiter='\t')
-
-        for idx, td in enumerate(trade_data_list, 1):
-            writer.writerow([
-                batch_id,
-                metric_type_id,
-                metric_code,
-                f"{td.exchange_prefix or ''}{td.stock_code}",  # 原始代码
-                td.stock_code,  # 净代码
-                td.exchange_prefix or '',
-                td.trade_date.isoformat(),
-                td.trade_value,
-                idx,  # 源行号
-                True  # is_valid
-            ])
-
-        output.seek(0)
-
-        # 第3步：使用COPY命令高速导入
-        cursor.copy_expert(
-            """
-            COPY stock_metric_data_raw (
-                import_batch_id, metric_type_id, metric_code,
-                stock_code_raw, stock_code, exchange_prefix,
-                trade_date, trade_value, source_row_number, is_valid
-            )
-            FROM STDIN WITH (FORMAT CSV, DELIMITER E'\\t', NULL '')
-            """,
-            output
+    def _copy_raw_rows(
+        self,
+        trade_data_list: List[TradeData],
+        batch_id: int,
+        metric_type_id: int,
+        metric_code: str,
+        row_offset: int = 0
+    ):
+        """将一批交易数据COPY到原始数据表，row_offset用于流式模式下延续源行号"""
+        self._copy_raw_columns(
+            ColumnarTrades.from_trades(trade_data_list),
+            batch_id,
+            metric_type_id,
+            metric_code,
+            row_offset
         )
 
-        logger.info(f"导入原始数据: {len(trade_data_list)}条完成")
+    def _copy_raw_columns(
+        self,
+        trades: ColumnarTrades,
+        batch_id: int,
+        metric_type_id: int,
+        metric_code: str,
+        row_offset: int = 0
+    ):
+        """将列式数据以二进制COPY写入原始数据表"""
+        conn = self.db.connection().connection
+        cursor = conn.cursor()
+
+        batch = self._raw_column_batch(trades, batch_id, metric_type_id, metric_code, row_offset)
+        pgcopy.copy_binary(cursor, 'stock_metric_data_raw', RAW_COLUMNS, batch)
+
+    def _raw_column_batch(
+        self,
+        trades: ColumnarTrades,
+        batch_id: int,
+        metric_type_id: int,
+        metric_code: str,
+        row_offset: int = 0
+    ) -> pgcopy.ColumnBatch:
+        """原始数据表的二进制COPY列
+
+        代码相关的列按代码表字典编码，每个代码只编码一次；
+        载荷在 copy_expert 读取时逐块生成。
+        """
+        # 空前缀写为NULL，与文本COPY（NULL ''）的结果一致
+        prefixes = [p or None for p in trades.exchange_prefixes]
+        raw_codes = [f"{p or ''}{code}" for code, p in zip(trades.stock_codes, trades.exchange_prefixes)]
+        n = len(trades)
+
+        return pgcopy.ColumnBatch([
+            pgcopy.int4(batch_id),
+            pgcopy.int4(metric_type_id),
+            pgcopy.text(metric_code),
+            pgcopy.text(raw_codes, trades.code_ids),
+            pgcopy.text(trades.stock_codes, trades.code_ids),
+            pgcopy.text(prefixes, trades.code_ids),
+            pgcopy.date_ordinals(trades.date_ordinals),
+            pgcopy.int8(trades.trade_values),
+            pgcopy.int4(np.arange(row_offset + 1, row_offset + n + 1, dtype=np.int32)),  # 源行号
+            pgcopy.boolean(True),  # is_valid
+        ], n)
 
     def _compute_rankings_in_memory(
         self,
@@ -246,93 +740,84 @@ class OptimizedTXTImportService:
         data_date: date
     ):
         """在内存中计算排名和汇总，然后批量写入"""
+        self._compute_rankings_from_values(
+            [td.stock_code for td in trade_data_list],
+            [td.trade_value for td in trade_data_list],
+            batch_id,
+            metric_type_id,
+            metric_code,
+            data_date
+        )
 
-        # 1. 按概念分组数据
-        concept_trades: Dict[int, List[TradeData]] = defaultdict(list)
+    def _compute_rankings_from_values(
+        self,
+        stock_codes: Sequence[str],
+        trade_values: Sequence[int],
+        batch_id: int,
+        metric_type_id: int,
+        metric_code: str,
+        data_date: date
+    ):
+        """根据 (股票代码, 交易值) 平行数组计算排名和汇总，然后批量写入"""
+        self._compute_rankings_indexed(
+            self.membership.lookup(stock_codes),
+            np.asarray(trade_values, dtype=np.int64),
+            batch_id,
+            metric_type_id,
+            metric_code,
+            data_date
+        )
 
-        for td in trade_data_list:
-            # 获取股票所属概念
-            concept_ids = self.stock_concepts_map.get(td.stock_code, [])
-            for concept_id in concept_ids:
-                concept_trades[concept_id].append(td)
+    def _compute_rankings_indexed(
+        self,
+        stock_idx: np.ndarray,
+        trade_values: np.ndarray,
+        batch_id: int,
+        metric_type_id: int,
+        metric_code: str,
+        data_date: date
+    ):
+        """基于CSR成员索引的向量化排名：一次整体展开分组 + 一次分段排序"""
 
-        # 2. 计算每个概念的排名和统计
-        rankings = []
-        summaries = []
+        # 1. 按概念分组并排序
+        ranking = self.membership.rank_within_concepts(stock_idx, trade_values)
 
-        for concept_id, trades in concept_trades.items():
-            if not trades:
-                continue
+        # 2. 计算汇总并写入
+        self._store_ranking(ranking, batch_id, metric_type_id, metric_code, data_date)
 
-            # 排序计算排名
-            sorted_trades = sorted(trades, key=lambda x: x.trade_value, reverse=True)
-            total_stocks = len(sorted_trades)
-
-            # 计算统计值
-            values = [t.trade_value for t in sorted_trades]
-            total_value = sum(values)
-            avg_value = total_value // total_stocks if total_stocks > 0 else 0
-            max_value = values[0] if values else 0
-            min_value = values[-1] if values else 0
-
-            # 中位数
-            median_value = self._calculate_median(values)
-
-            # 生成排名记录
-            for rank, td in enumerate(sorted_trades, 1):
-                rankings.append({
-                    'metric_type_id': metric_type_id,
-                    'metric_code': metric_code,
-                    'concept_id': concept_id,
-                    'stock_code': td.stock_code,
-                    'trade_date': data_date,
-                    'trade_value': td.trade_value,
-                    'rank': rank,
-                    'import_batch_id': batch_id
-                })
-
-            # 生成汇总记录
-            summaries.append({
-                'metric_type_id': metric_type_id,
-                'metric_code': metric_code,
-                'concept_id': concept_id,
-                'trade_date': data_date,
-                'total_value': total_value,
-                'avg_value': avg_value,
-                'max_value': max_value,
-                'min_value': min_value,
-                'median_value': median_value,
-                'import_batch_id': batch_id
-            })
-
-        # 3. 批量插入排名数据
-        self._bulk_insert_rankings(rankings)
-
-        # 4. 批量插入汇总数据
-        self._bulk_insert_summaries(summaries)
-
-        logger.info(f"计算完成: {len(rankings)}条排名, {len(summaries)}条汇总")
-
-    def _calculate_median(self, values: List[int]) -> int:
-        """计算中位数"""
-        if not values:
-            return 0
-
-        sorted_values = sorted(values)
-        n = len(sorted_values)
-
-        if n % 2 == 0:
-            return (sorted_values[n//2 - 1] + sorted_values[n//2]) // 2
-        else:
-            return sorted_values[n//2]
+    def _store_ranking(
+        self,
+        ranking: ConceptRanking,
+        batch_id: int,
+        metric_type_id: int,
+        metric_code: str,
+        data_date: date
+    ):
+        """根据已排好的概念排名计算汇总，并批量写入排名和汇总表"""
 
-    def _bulk_insert_rankings(self, rankings: List[Dict]):
-        """批量插入排名数据"""
-        if not rankings:
-            return
+        # 1. 计算每个概念的统计值
+        stats = ranking.summary_arrays()
+
+        # 2. 批量写入排名数据
+        self._bulk_insert_rankings(ranking, batch_id, metric_type_id, metric_code, data_date)
+
+        # 3. 批量写入汇总数据
+        self._bulk_insert_summaries(ranking, stats, batch_id, metric_type_id, metric_code, data_date)
 
-        metric_type_id = rankings[0]['metric_type_id']
-        trade_date = rankings[0]['trade_date']
+        logger.info(f"计算完成: {len(ranking.ranks)}条排名, {len(ranking.segment_starts)}条汇总")
+
+    def _bulk_insert_rankings(
+        self,
+        ranking: ConceptRanking,
+        batch_id: int,
+        metric_type_id: int,
+        metric_code: str,
+        trade_date: date
+    ):
+        """批量写入排名数据：二进制COPY到暂存表后一次 INSERT ... SELECT 合并"""
+        n = len(ranking.ranks)
+        if not n:
+            return
 
         # 获取原生连接和游标
         conn = self.db.connection().connection
@@ -350,65 +835,42 @@ class OptimizedTXTImportService:
         # 关键：提交删除操作，确保后续COPY能看到最新状态
         conn.commit()
 
-        # 第2步：准备COPY数据
-        output = StringIO()
-        writer = csv.writer(output, delimiter='\t')
-
-        for r in rankings:
-            writer.writerow([
-                r['metric_type_id'],
-                r['metric_code'],
-                r['concept_id'],
-                r['stock_code'],
-                r['trade_date'].isoformat(),
-                r['trade_value'],
-                r['rank'],
-                r['import_batch_id']
-            ])
-
-        output.seek(0)
-
-        # 第3步：使用 INSERT...ON CONFLICT 插入新数据（处理重复）
-        if rankings:
-            # 分批插入避免SQL过长
-            batch_size = 1000
-            for batch_idx in range(0, len(rankings), batch_size):
-                batch_records = rankings[batch_idx:batch_idx + batch_size]
-                values = []
-
-                for r in batch_records:
-                    # 正确处理字符串转义
-                    values.append(f"""(
-                        {r['metric_type_id']},
-                        '{r['metric_code'].replace("'", "''")}',
-                        {r['concept_id']},
-                        '{r['stock_code'].replace("'", "''")}',
-                        '{r['trade_date']}',
-                        {r['trade_value']},
-                        {r['rank']},
-                        {r['import_batch_id']}
-                    )""")
-
-                insert_sql = f"""
-                    INSERT INTO concept_stock_daily_rank (
-                        metric_type_id, metric_code, concept_id, stock_code,
-                        trade_date, trade_value, rank, import_batch_id
-                    )
-                    VALUES {','.join(values)}
-                    ON CONFLICT (metric_type_id, concept_id, stock_code, trade_date)
-                    DO NOTHING
-                """
-                cursor.execute(insert_sql)
-
-        logger.info(f"插入排名数据: {len(rankings)}条（重复自动跳过）")
-
-    def _bulk_insert_summaries(self, summaries: List[Dict]):
-        """批量插入汇总数据"""
-        if not summaries:
-            return
+        # 第2步：COPY到暂存表，再集合式合并（同键重复保留首条）
+        batch = pgcopy.ColumnBatch([
+            pgcopy.int4(metric_type_id),
+            pgcopy.text(metric_code),
+            pgcopy.int4(ranking.concept_ids),
+            pgcopy.text(self.membership.stock_codes, ranking.stock_idx),
+            pgcopy.date_ordinals(trade_date.toordinal()),
+            pgcopy.int8(ranking.trade_values),
+            pgcopy.int4(ranking.ranks),
+            pgcopy.int4(batch_id),
+        ], n)
+
+        written = BulkLoader(cursor).upsert(
+            'concept_stock_daily_rank',
+            RANK_COLUMNS,
+            batch,
+            conflict_columns=('metric_type_id', 'concept_id', 'stock_code', 'trade_date'),
+            update_columns=('metric_code', 'trade_value', 'rank', 'import_batch_id'),
+            touch_column='computed_at'
+        )
 
-        metric_type_id = summaries[0]['metric_type_id']
-        trade_date = summaries[0]['trade_date']
+        logger.info(f"写入排名数据: {written}条")
+
+    def _bulk_insert_summaries(
+        self,
+        ranking: ConceptRanking,
+        stats: Dict[str, np.ndarray],
+        batch_id: int,
+        metric_type_id: int,
+        metric_code: str,
+        trade_date: date
+    ):
+        """批量写入汇总数据：二进制COPY到暂存表后一次 INSERT ... SELECT 合并"""
+        n = len(ranking.segment_starts)
+        if not n:
+            return
 
         # 获取原生连接和游标
         conn = self.db.connection().connection
@@ -426,59 +888,27 @@ class OptimizedTXTImportService:
         # 关键：提交删除操作，确保后续COPY能看到最新状态
         conn.commit()
 
-        # 第2步：准备COPY数据
-        output = StringIO()
-        writer = csv.writer(output, delimiter='\t')
-
-        for s in summaries:
-            writer.writerow([
-                s['metric_type_id'],
-                s['metric_code'],
-                s['concept_id'],
-                s['trade_date'].isoformat(),
-                s['total_value'],
-                s['avg_value'],
-                s['max_value'],
-                s['min_value'],
-                s['median_value'],
-                s['import_batch_id']
-            ])
-
-        output.seek(0)
-
-        # 第3步：使用 INSERT...ON CONFLICT 插入新数据（处理重复）
-        if summaries:
-            # 分批插入避免SQL过长
-            batch_size = 1000
-            for batch_idx in range(0, len(summaries), batch_size):
-                batch_records = summaries[batch_idx:batch_idx + batch_size]
-                values = []
-
-                for s in batch_records:
-                    # 正确处理字符串转义
-                    values.append(f"""(
-                        {s['metric_type_id']},
-                        '{s['metric_code'].replace("'", "''")}',
-                        {s['concept_id']},
-                        '{s['trade_date']}',
-                        {s['total_value']},
-                        {s['avg_value']},
-                        {s['max_value']},
-                        {s['min_value']},
-                        {s['median_value']},
-                        {s['import_batch_id']}
-                    )""")
-
-                insert_sql = f"""
-                    INSERT INTO concept_daily_summary (
-                        metric_type_id, metric_code, concept_id, trade_date,
-                        total_value, avg_value, max_value, min_value,
-                        median_value, import_batch_id
-                    )
-                    VALUES {','.join(values)}
-                    ON CONFLICT (metric_type_id, concept_id, trade_date)
-                    DO NOTHING
-                """
-                cursor.execute(insert_sql)
-
-        logger.info(f"插入汇总数据: {len(summaries)}条（重复自动跳过）")
\ No newline at end of file
+        # 第2步：COPY到暂存表，再集合式合并
+        batch = pgcopy.ColumnBatch([
+            pgcopy.int4(metric_type_id),
+            pgcopy.text(metric_code),
+            pgcopy.int4(ranking.segment_concepts),
+            pgcopy.date_ordinals(trade_date.toordinal()),
+            pgcopy.int8(stats['total']),
+            pgcopy.int8(stats['avg']),
+            pgcopy.int8(stats['max']),
+            pgcopy.int8(stats['min']),
+            pgcopy.int8(stats['median']),
+            pgcopy.int4(batch_id),
+        ], n)
+
+        written = BulkLoader(cursor).upsert(
+            'concept_daily_summary',
+            SUMMARY_COLUMNS,
+            batch,
+            conflict_columns=('metric_type_id', 'concept_id', 'trade_date'),
+            update_columns=SUMMARY_COLUMNS[4:],
+            touch_column='computed_at'
+        )
+
+        logger.info(f"写入汇总数据: {written}条")
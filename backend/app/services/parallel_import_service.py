@@ -1,35 +1,106 @@
-"""并行导入服务 - 处理大文件"""
+"""并行导入服务 - 处理大文件
+
+多进程 map/reduce：文件按行边界切成字节区间，工作进程各自解析、过滤并按概念做部分排名，
+只返回紧凑的数组；父进程按块顺序COPY原始数据，再对各块的有序结果做k路归并得到最终排名。
+"""
 import concurrent.futures
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union
 from dataclasses import dataclass
+from datetime import date
+import mmap
+import multiprocessing
+import os
 import threading
 from queue import Queue
 import logging
 from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy import create_engine
 from app.core.config import settings
+from app.services import pg_binary_copy as pgcopy
+from app.services.membership_index import ConceptRanking
+from app.services.optimized_txt_import import (
+    ColumnarTrades,
+    MappingSnapshot,
+    OptimizedTXTImportService,
+    RAW_COLUMNS,
+)
 
 logger = logging.getLogger(__name__)
 
+# 每个块的目标字节数（块数至少为进程数）
+PARALLEL_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def _worker_context():
+    """工作进程的启动方式
+
+    Web进程里已有线程池、数据库连接池等后台线程，直接 fork 时子进程可能继承被占用的锁而卡死；
+    forkserver 从干净的单线程服务进程派生工作进程（不支持时退回 spawn）。
+    """
+    methods = multiprocessing.get_all_start_methods()
+    if 'forkserver' in methods:
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+# 块的数据来源：内存中的字节，或 (文件路径, 起点, 终点)
+ChunkSource = Union[bytes, Tuple[str, int, int]]
+
 
 @dataclass
 class ChunkResult:
-    """块处理结果"""
+    """块处理结果：有效行的列式数据 + 块内按概念排好的部分排名"""
     chunk_id: int
     success_count: int
     error_count: int
-    data: List
+    trades: ColumnarTrades
+    ranking: ConceptRanking
+
+
+# 工作进程内的映射快照，由进程池 initializer 安装
+_worker_snapshot: Optional[MappingSnapshot] = None
+
+
+def _init_worker(snapshot: MappingSnapshot):
+    global _worker_snapshot
+    _worker_snapshot = snapshot
+
+
+def _map_chunk(chunk_id: int, source: ChunkSource, data_date: date) -> ChunkResult:
+    """工作进程：解析一个块、过滤有效股票、按概念做部分排名"""
+    if isinstance(source, bytes):
+        block = source
+    else:
+        file_path, start, end = source
+        with open(file_path, 'rb') as f:
+            f.seek(start)
+            block = f.read(end - start)
+
+    parser = OptimizedTXTImportService(None)
+    parser.use_mapping_snapshot(_worker_snapshot)
+
+    trades = parser._parse_file_columnar(block, data_date)
+    valid = trades.take(trades.valid_mask(parser.valid_stocks))
+    stock_idx = parser.membership.lookup(valid.stock_codes)[valid.code_ids]
+
+    return ChunkResult(
+        chunk_id=chunk_id,
+        success_count=len(valid),
+        error_count=len(trades) - len(valid),
+        trades=valid,
+        ranking=parser.membership.rank_within_concepts(stock_idx, valid.trade_values),
+    )
 
 
 class ParallelTXTImportService:
-    """并行处理大文件的TXT导入服务"""
+    """并行处理大文件的TXT导入服务（多进程）"""
 
     def __init__(self, db_session_factory: sessionmaker):
         """
-        使用session factory而不是单个session，因为需要多线程处理
+        使用session factory而不是单个session：映射加载和最终写入各用独立的session
         """
         self.db_session_factory = db_session_factory
-        self.results_queue = Queue()
 
     def process_large_file(
         self,
@@ -41,7 +112,7 @@ class ParallelTXTImportService:
         num_workers: int = 4
     ) -> Tuple[int, int]:
         """
-        并行处理大文件
+        并行处理内存中的大文件
 
         Args:
             file_content: 文件内容
@@ -49,125 +120,110 @@ class ParallelTXTImportService:
             metric_type_id: 指标类型ID
             metric_code: 指标代码
             data_date: 数据日期
-            num_workers: 并行工作线程数
+            num_workers: 工作进程数
         """
+        ranges = self._split_line_ranges(file_content, len(file_content), num_workers)
+        sources = (file_content[start:end] for start, end in ranges)
+        return self._run(sources, len(ranges), batch_id, metric_type_id, metric_code, data_date, num_workers)
 
-        # 1. 分割文件为多个块
-        chunks = self._split_file_into_chunks(file_content, num_workers)
-
-        logger.info(f"文件分割为{len(chunks)}个块进行并行处理")
-
-        # 2. 创建线程池并行处理
-        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
-            futures = []
-
-            for chunk_id, chunk in enumerate(chunks):
-                future = executor.submit(
-                    self._process_chunk,
-                    chunk,
-                    chunk_id,
-                    batch_id,
-                    metric_type_id,
-                    metric_code,
-                    data_date
-                )
-                futures.append(future)
-
-            # 3. 收集结果
-            results = []
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    result = future.result()
-                    results.append(result)
-                    logger.info(f"块{result.chunk_id}处理完成: 成功{result.success_count}条")
-                except Exception as e:
-                    logger.error(f"块处理失败: {e}")
-
-        # 4. 合并结果并计算
-        return self._merge_and_compute(results, batch_id, metric_type_id, metric_code, data_date)
-
-    def _split_file_into_chunks(self, file_content: bytes, num_chunks: int) -> List[bytes]:
-        """
-        智能分割文件，确保每个块在行边界处分割
-        """
-        try:
-            content = file_content.decode('utf-8')
-        except:
-            content = file_content.decode('gbk')
-
-        lines = content.strip().split('\n')
-        total_lines = len(lines)
-
-        # 计算每个块的大小
-        chunk_size = max(1, total_lines // num_chunks)
-
-        chunks = []
-        for i in range(num_chunks):
-            start_idx = i * chunk_size
-            if i == num_chunks - 1:
-                # 最后一个块包含所有剩余行
-                end_idx = total_lines
+    def process_file(
+        self,
+        file_path: str,
+        batch_id: int,
+        metric_type_id: int,
+        metric_code: str,
+        data_date,
+        num_workers: int = 4
+    ) -> Tuple[int, int]:
+        """并行处理磁盘上的大文件：工作进程按偏移自行读取各自的区间"""
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    ranges = self._split_line_ranges(mm, size, num_workers)
             else:
-                end_idx = (i + 1) * chunk_size
+                ranges = []
 
-            chunk_lines = lines[start_idx:end_idx]
-            if chunk_lines:
-                chunk_content = '\n'.join(chunk_lines).encode('utf-8')
-                chunks.append(chunk_content)
+        sources = ((file_path, start, end) for start, end in ranges)
+        return self._run(sources, len(ranges), batch_id, metric_type_id, metric_code, data_date, num_workers)
 
-        return chunks
+    def _split_line_ranges(self, buf, size: int, num_workers: int) -> List[Tuple[int, int]]:
+        """
+        在行边界处把 [0, size) 切成若干字节区间，不解码、不复制
 
-    def _process_chunk(
+        换行符 0x0A 不会出现在 UTF-8/GBK 多字节字符内部，按字节切分是安全的。
+        """
+        num_chunks = max(num_workers, -(-size // PARALLEL_CHUNK_SIZE))
+        target = max(1, -(-size // num_chunks))
+
+        ranges = []
+        start = 0
+        while start < size:
+            end = min(start + target, size)
+            if end < size:
+                newline = buf.find(b'\n', end - 1)
+                end = size if newline < 0 else newline + 1
+            ranges.append((start, end))
+            start = end
+        return ranges
+
+    def _run(
         self,
-        chunk_content: bytes,
-        chunk_id: int,
+        sources,
+        num_chunks: int,
         batch_id: int,
         metric_type_id: int,
         metric_code: str,
-        data_date
-    ) -> ChunkResult:
-        """
-        处理单个块
-        """
-        # 为每个线程创建独立的session
+        data_date,
+        num_workers: int
+    ) -> Tuple[int, int]:
+        # 1. 父进程加载一次映射快照，工作进程通过initializer获得
         session = self.db_session_factory()
-
         try:
-            # 导入优化的TXT服务
-            from app.services.optimized_txt_import import OptimizedTXTImportService, TradeData
-
-            service = OptimizedTXTImportService(session)
-
-            # 解析块内容
-            trade_data_list = service._parse_file_content(chunk_content, data_date)
-
-            # 预加载映射（每个线程独立加载）
-            service.preload_mappings()
-
-            # 过滤有效数据
-            valid_trades = [
-                td for td in trade_data_list
-                if td.stock_code in service.valid_stocks
-            ]
-
-            # 返回结果（不立即写入数据库）
-            return ChunkResult(
-                chunk_id=chunk_id,
-                success_count=len(valid_trades),
-                error_count=len(trade_data_list) - len(valid_trades),
-                data=valid_trades
-            )
-
-        except Exception as e:
-            logger.error(f"块{chunk_id}处理失败: {e}")
-            return ChunkResult(chunk_id=chunk_id, success_count=0, error_count=0, data=[])
-
+            snapshot = OptimizedTXTImportService.load_mapping_snapshot(session)
         finally:
             session.close()
 
+        logger.info(f"文件分割为{num_chunks}个块，使用{num_workers}个进程并行处理")
+
+        # 2. map：多进程解析、过滤、部分排名
+        results = self._map_chunks(sources, snapshot, data_date, num_workers)
+
+        # 3. reduce：按块顺序写原始数据，k路归并排名
+        return self._merge_and_compute(results, snapshot, batch_id, metric_type_id, metric_code, data_date)
+
+    def _map_chunks(self, sources, snapshot: MappingSnapshot, data_date, num_workers: int) -> List[ChunkResult]:
+        """提交块任务（同时在途的块数有上限，避免一次性复制所有块），按块顺序返回结果"""
+        results: Dict[int, ChunkResult] = {}
+
+        def collect(done):
+            for future in done:
+                result = future.result()
+                results[result.chunk_id] = result
+                logger.info(f"块{result.chunk_id}处理完成: 成功{result.success_count}条")
+
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=_worker_context(),
+            initializer=_init_worker,
+            initargs=(snapshot,)
+        ) as executor:
+            pending = set()
+            for chunk_id, source in enumerate(sources):
+                if len(pending) >= num_workers * 2:
+                    done, pending = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    collect(done)
+                pending.add(executor.submit(_map_chunk, chunk_id, source, data_date))
+            collect(concurrent.futures.wait(pending)[0])
+
+        return [results[chunk_id] for chunk_id in sorted(results)]
+
     def _merge_and_compute(
         self,
         results: List[ChunkResult],
+        snapshot: MappingSnapshot,
         batch_id: int,
         metric_type_id: int,
         metric_code: str,
@@ -180,34 +236,31 @@ class ParallelTXTImportService:
         session = self.db_session_factory()
 
         try:
-            from app.services.optimized_txt_import import OptimizedTXTImportService
-
             service = OptimizedTXTImportService(session)
-            service.preload_mappings()
+            service.use_mapping_snapshot(snapshot)
 
-            # 合并所有交易数据
-            all_trades = []
-            total_success = 0
-            total_error = 0
+            total_success = sum(r.success_count for r in results)
+            total_error = sum(r.error_count for r in results)
 
-            for result in results:
-                all_trades.extend(result.data)
-                total_success += result.success_count
-                total_error += result.error_count
+            logger.info(f"合并完成: 总计{total_success}条有效数据")
 
-            logger.info(f"合并完成: 总计{len(all_trades)}条有效数据")
+            # 按块顺序一次COPY原始数据，源行号跨块连续
+            valid_parts = [r.trades for r in results if r.success_count]
+            if valid_parts:
+                service._delete_raw_data(metric_type_id, date.fromordinal(int(valid_parts[0].date_ordinals[0])))
 
-            # 批量导入原始数据
-            service._bulk_import_raw_data(all_trades, batch_id, metric_type_id, metric_code)
+                def raw_batches():
+                    row_offset = 0
+                    for trades in valid_parts:
+                        yield service._raw_column_batch(trades, batch_id, metric_type_id, metric_code, row_offset)
+                        row_offset += len(trades)
 
-            # 计算排名和汇总
-            service._compute_rankings_in_memory(
-                all_trades,
-                batch_id,
-                metric_type_id,
-                metric_code,
-                data_date
-            )
+                cursor = session.connection().connection.cursor()
+                pgcopy.copy_binary_batches(cursor, 'stock_metric_data_raw', RAW_COLUMNS, raw_batches())
+
+            # 各块内已按概念排好序，归并后与整体排名一致
+            ranking = ConceptRanking.merge([r.ranking for r in results])
+            service._store_ranking(ranking, batch_id, metric_type_id, metric_code, data_date)
 
             session.commit()
 
@@ -272,6 +325,11 @@ class AsyncImportQueue:
         except Exception as e:
             logger.error(f"导入任务失败: {e}")
             raise
+        finally:
+            # 清理已处理的上传文件
+            file_path = task_info.get('file_path')
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
 
     def _process_txt_import(self, task_info: dict):
         """处理TXT导入"""
@@ -279,11 +337,11 @@ class AsyncImportQueue:
         engine = create_engine(settings.DATABASE_URL)
         SessionFactory = sessionmaker(bind=engine)
 
-        # 使用并行导入服务
+        # 使用并行导入服务（上传已落盘，工作进程按偏移读取）
         service = ParallelTXTImportService(SessionFactory)
 
-        return service.process_large_file(
-            task_info['file_content'],
+        return service.process_file(
+            task_info['file_path'],
             task_info['batch_id'],
             task_info['metric_type_id'],
             task_info['metric_code'],
@@ -0,0 +1,119 @@
+"""线程流水线 - 用有界队列串联多个处理阶段，各阶段在独立线程上重叠执行"""
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence
+import queue
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+# 阻塞的 put/get 每隔多久检查一次停止标志（秒）
+_POLL_INTERVAL = 0.1
+
+
+class StagePipeline:
+    """source → stage1 → stage2 → ... → 消费者
+
+    source 在一个线程中迭代，每个 stage 占一个线程，按顺序逐项处理；
+    stage 返回 None 表示丢弃该项。队列有界，慢阶段会对上游形成背压，
+    内存占用只与 queue_depth 和单项大小有关。
+
+    任一阶段出错时，所有线程停止，异常在消费者迭代处重新抛出。
+    消费者提前退出时应调用 close()（或使用 with 语句）。
+
+    NumPy/pandas 的大块运算和数据库I/O会释放GIL，因此线程足以让各阶段重叠。
+    """
+
+    def __init__(
+        self,
+        source: Iterable[Any],
+        stages: Sequence[Callable[[Any], Optional[Any]]],
+        queue_depth: int = 4,
+        name: str = 'pipeline'
+    ):
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._queues: List[queue.Queue] = [queue.Queue(maxsize=queue_depth) for _ in range(len(stages) + 1)]
+        self._threads = [threading.Thread(target=self._run_source, args=(source,), name=f"{name}-source", daemon=True)]
+        for i, stage in enumerate(stages):
+            self._threads.append(threading.Thread(
+                target=self._run_stage,
+                args=(stage, self._queues[i], self._queues[i + 1]),
+                name=f"{name}-stage{i + 1}",
+                daemon=True
+            ))
+        for thread in self._threads:
+            thread.start()
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue) -> Any:
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, exc: BaseException):
+        if self._error is None:
+            self._error = exc
+        self._stop.set()
+
+    def _run_source(self, source: Iterable[Any]):
+        try:
+            for item in source:
+                if not self._put(self._queues[0], item):
+                    return
+        except BaseException as exc:
+            logger.error(f"流水线数据源出错: {exc}")
+            self._fail(exc)
+        self._put(self._queues[0], _DONE)
+
+    def _run_stage(self, stage: Callable[[Any], Optional[Any]], inbox: queue.Queue, outbox: queue.Queue):
+        try:
+            while True:
+                item = self._get(inbox)
+                if item is _DONE:
+                    break
+                result = stage(item)
+                if result is not None and not self._put(outbox, result):
+                    return
+        except BaseException as exc:
+            logger.error(f"流水线阶段出错: {exc}")
+            self._fail(exc)
+        self._put(outbox, _DONE)
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            try:
+                item = self._queues[-1].get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                if self._error is not None:
+                    raise self._error
+                continue
+            if item is _DONE:
+                break
+            yield item
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """停止所有阶段并等待线程退出"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self) -> "StagePipeline":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,105 @@
+"""上传文件落盘 - 分块写入 UPLOAD_DIR，同时计算 SHA-256、大小并截取首行
+
+上传内容不会整体读入内存：每次只读一个块，写盘后即丢弃。
+首行用于在未提供日期时从内容嗅探数据日期。
+"""
+from dataclasses import dataclass
+from typing import Optional
+import hashlib
+import logging
+import os
+import re
+import tempfile
+
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+# 每次从上传流读取的字节数
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 首行最多保留的字节数（超出部分不再缓存）
+MAX_FIRST_LINE_BYTES = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """上传内容超过大小限制"""
+
+
+@dataclass
+class StoredUpload:
+    """已落盘的上传文件"""
+    path: str
+    size: int
+    sha256: str
+    first_line: bytes
+    owned: bool = True  # 为 False 时文件已移交给后台任务，由其负责删除
+
+    def hand_off(self, path: str) -> str:
+        """重命名到 path 并移交给后台任务，此后 remove() 不再删除"""
+        os.replace(self.path, path)
+        self.path = path
+        self.owned = False
+        return path
+
+    def remove(self):
+        """删除仍归本请求所有的落盘文件（不存在时忽略）"""
+        if self.owned and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def safe_file_name(file_name: Optional[str]) -> str:
+    """去掉目录部分和路径分隔符，避免写出 UPLOAD_DIR"""
+    name = os.path.basename(file_name or "upload")
+    return re.sub(r'[\\/\x00]', '_', name) or "upload"
+
+
+async def store_upload(
+    file: UploadFile,
+    upload_dir: str,
+    max_size: int,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> StoredUpload:
+    """把上传流分块写入 upload_dir 下的临时文件
+
+    Raises:
+        UploadTooLarge: 超过 max_size 时中止并删除已写入的部分
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=upload_dir, prefix="upload_", suffix=f"_{safe_file_name(file.filename)}")
+
+    digest = hashlib.sha256()
+    size = 0
+    first_line = bytearray()
+    first_line_done = False
+
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(f"File too large. Max size: {max_size} bytes")
+
+                digest.update(chunk)
+                out.write(chunk)
+
+                if not first_line_done:
+                    newline = chunk.find(b'\n')
+                    first_line += chunk if newline < 0 else chunk[:newline]
+                    first_line_done = newline >= 0 or len(first_line) >= MAX_FIRST_LINE_BYTES
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    logger.info(f"上传已落盘: {path} ({size} bytes)")
+    return StoredUpload(
+        path=path,
+        size=size,
+        sha256=digest.hexdigest(),
+        first_line=bytes(first_line[:MAX_FIRST_LINE_BYTES]),
+    )
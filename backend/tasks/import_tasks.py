@@ -16,12 +16,8 @@ def process_csv_import(self, batch_id: int, file_path: str):
     try:
         import_service = ImportService(db)
 
-        # Read file
-        with open(file_path, "rb") as f:
-            file_content = f.read()
-
-        # 调用统一导入方法
-        success_count, error_count = import_service.import_csv_file(batch_id, file_content)
+        # 调用统一导入方法（pandas 直接读取磁盘文件）
+        success_count, error_count = import_service.import_csv_file(batch_id, file_path)
 
         # Clean up file
         if os.path.exists(file_path):
@@ -58,14 +54,11 @@ def process_txt_import(
         # Parse data date
         data_date = date.fromisoformat(data_date_str)
 
-        # Read file
+        # Stream file from disk (bounded memory)
         with open(file_path, "rb") as f:
-            file_content = f.read()
-
-        # 调用统一导入方法
-        success_count, error_count = import_service.import_txt_file(
-            batch_id, file_content, metric_type_id, data_date
-        )
+            success_count, error_count = import_service.import_txt_stream(
+                batch_id, f, metric_type_id, data_date
+            )
 
         # Clean up file
         if os.path.exists(file_path):
@@ -16,6 +16,9 @@ Examples:
 
     # 只处理特定日期范围
     python imports/batch_import.py /path/to/EEE.txt --type TXT --metric-code EEE --start-date 2024-01-01 --end-date 2024-12-31
+
+    # 旧的扫描方式（整文件读入内存并拆分为临时文件）
+    python imports/batch_import.py /path/to/EEE.txt --type TXT --metric-code EEE --scan-mode lines
 """
 
 import sys
@@ -27,6 +30,7 @@ import argparse
 import json
 from dataclasses import dataclass, asdict
 from collections import defaultdict
+import mmap
 import multiprocessing as mp
 from multiprocessing import Pool, Queue, Manager
 import logging
@@ -36,6 +40,8 @@ import tempfile
 import signal
 import atexit
 
+import numpy as np
+
 # 添加项目路径
 # 脚本位置: imports/batch_import.py
 # 需要访问: backend/app/...
@@ -46,7 +52,7 @@ sys.path.insert(0, backend_path)
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
 from app.core.config import settings
-from app.services.optimized_txt_import import OptimizedTXTImportService
+from app.services.optimized_txt_import import OptimizedTXTImportService, share_mapping_snapshot
 from app.models.stock import ImportBatch, MetricType
 
 # 创建数据库会话
@@ -61,12 +67,24 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# mmap扫描时每次处理的字节数
+SCAN_CHUNK_SIZE = 16 * 1024 * 1024
+
+# 日期字段的最大字节数，超出的行走逐行兼容路径
+MAX_DATE_FIELD_BYTES = 32
+
+
 @dataclass
 class DateBatch:
-    """日期批次数据"""
+    """日期批次数据
+
+    lines 模式保存行文本；mmap 模式只保存该日期在源文件中的字节区间
+    ranges（N×2 的 [start, end)，按文件顺序），由工作进程按偏移自行读取。
+    """
     trade_date: str
-    lines: List[str]
     count: int
+    lines: Optional[List[str]] = None
+    ranges: Optional[np.ndarray] = None
 
 
 @dataclass
@@ -109,9 +127,10 @@ class ImportProgress:
 class BatchImporter:
     """批量导入器"""
 
-    def __init__(self, metric_code: str, parallel: int = 1):
+    def __init__(self, metric_code: str, parallel: int = 1, scan_mode: str = 'mmap'):
         self.metric_code = metric_code
         self.parallel = max(1, min(parallel, mp.cpu_count()))
+        self.scan_mode = scan_mode
         self.progress_file = f"/tmp/batch_import_{metric_code}.json"
         self.temp_dir = tempfile.mkdtemp(prefix=f"batch_import_{metric_code}_")
         self.progress = None
@@ -223,6 +242,162 @@ class BatchImporter:
         logger.info(f"扫描完成: {len(result)}个日期, {line_count}条数据")
         return result
 
+    def scan_file_mmap(self, file_path: str) -> Dict[str, DateBatch]:
+        """mmap扫描文件，一遍记录每个日期的字节区间
+
+        父进程不保存行文本，也不写临时文件；同一日期的相邻行合并为一个区间，
+        按日期分组存放的历史文件每个日期只有一个区间。
+        分组规则与 scan_file 一致（去首尾空白后按制表符/空白切分，取第2列）。
+        """
+        logger.info(f"开始扫描文件(mmap): {file_path}")
+
+        ranges_by_date: Dict[str, List[List[int]]] = defaultdict(list)
+        counts: Dict[str, int] = defaultdict(int)
+
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                logger.info("扫描完成: 0个日期, 0条数据")
+                return {}
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                    tqdm(total=size, unit='B', unit_scale=True, desc="扫描文件") as pbar:
+                pos = 0
+                while pos < size:
+                    end = min(pos + SCAN_CHUNK_SIZE, size)
+                    if end < size:
+                        # 块只在换行符处结束
+                        cut = mm.rfind(b'\n', pos, end)
+                        if cut >= 0:
+                            end = cut + 1
+                        else:
+                            end = mm.find(b'\n', end) + 1 or size
+
+                    for trade_date, start, stop, count in self._scan_block(mm, pos, end):
+                        date_ranges = ranges_by_date[trade_date]
+                        if date_ranges and date_ranges[-1][1] == start:
+                            date_ranges[-1][1] = stop  # 跨块的连续区间
+                        else:
+                            date_ranges.append([start, stop])
+                        counts[trade_date] += count
+
+                    # 已扫描的页不再需要，交还给页缓存，常驻内存不随文件大小增长
+                    if hasattr(mm, 'madvise'):
+                        page_start = pos - pos % mmap.PAGESIZE
+                        mm.madvise(mmap.MADV_DONTNEED, page_start, end - page_start)
+
+                    pbar.update(end - pos)
+                    pos = end
+
+        result = {
+            trade_date: DateBatch(
+                trade_date=trade_date,
+                count=counts[trade_date],
+                ranges=np.asarray(date_ranges, dtype=np.int64)
+            )
+            for trade_date, date_ranges in ranges_by_date.items()
+        }
+
+        logger.info(f"扫描完成: {len(result)}个日期, {sum(counts.values())}条数据")
+        return result
+
+    def _scan_block(self, mm: mmap.mmap, base: int, end: int) -> List[Tuple[str, int, int, int]]:
+        """扫描 [base, end) 内的完整行，返回 (日期, 区间起点, 区间终点, 行数) 列表
+
+        首尾为可见ASCII字符、制表符分隔的常规行整体向量化处理；
+        其余行（空白分隔、首尾有空白或非ASCII字符等）逐行按 scan_file 的规则处理。
+        """
+        buf = np.frombuffer(mm, dtype=np.uint8, count=end - base, offset=base)
+        try:
+            n_bytes = len(buf)
+            newlines = np.flatnonzero(buf == 10)
+            starts = np.concatenate(([0], newlines + 1))
+            ends = np.concatenate((newlines, [n_bytes]))  # 不含换行符
+            if starts[-1] == n_bytes:
+                starts, ends = starts[:-1], ends[:-1]
+
+            # 去掉行尾的 \r
+            has_cr = (ends > starts) & (buf[np.maximum(ends - 1, 0)] == 13)
+            content_ends = ends - has_cr
+
+            nonempty = content_ends > starts
+            first = buf[np.minimum(starts, n_bytes - 1)]
+            last = buf[np.maximum(content_ends - 1, 0)]
+            plain = nonempty & (first > 32) & (first < 127) & (last > 32) & (last < 127)
+
+            tabs = np.flatnonzero(buf == 9)
+            tabs = np.append(tabs, [n_bytes, n_bytes])  # 哨兵
+            i1 = np.searchsorted(tabs, starts)
+            t1 = tabs[i1]
+            t2 = tabs[np.minimum(i1 + 1, len(tabs) - 1)]
+
+            tabbed = plain & (t1 < content_ends)
+            # 含制表符但不足三列的行与 scan_file 一样跳过
+            fields_ok = tabbed & (t2 < content_ends)
+            date_len = t2 - t1 - 1
+            vector = fields_ok & (date_len <= MAX_DATE_FIELD_BYTES)
+            fallback = (nonempty & ~plain) | (plain & ~tabbed) | (fields_ok & ~vector)
+
+            # 日期字段按定长字节串取出后去重
+            key_ids = np.full(len(starts), -1, dtype=np.int64)
+            keys: List[str] = []
+            rows = np.flatnonzero(vector)
+            if len(rows):
+                width = int(date_len[rows].max()) or 1
+                offsets = np.arange(width)
+                index = (t1[rows] + 1)[:, None] + offsets
+                fields = buf[np.minimum(index, n_bytes - 1)]
+                fields[offsets >= date_len[rows][:, None]] = 0
+                unique_fields, inverse = np.unique(
+                    fields.view(f'S{width}').ravel(),
+                    return_inverse=True
+                )
+                keys = [self._decode(field) for field in unique_fields]
+                key_ids[rows] = inverse
+
+            if fallback.any():
+                key_index = {key: i for i, key in enumerate(keys)}
+                for row in np.flatnonzero(fallback).tolist():
+                    line = self._decode(bytes(buf[starts[row]:ends[row]])).strip()
+                    if not line:
+                        continue
+                    parts = line.split('\t') if '\t' in line else line.split()
+                    if len(parts) >= 3:
+                        key_ids[row] = key_index.setdefault(parts[1], len(key_index))
+                keys = list(key_index)
+
+            line_stops = np.minimum(ends + 1, n_bytes)  # 区间包含换行符
+        finally:
+            del buf  # 释放对mmap的引用
+
+        # 相同日期的相邻行合并为一个区间
+        valid = np.flatnonzero(key_ids >= 0)
+        if not len(valid):
+            return []
+        ids = key_ids[valid]
+        breaks = np.flatnonzero((np.diff(valid) != 1) | (np.diff(ids) != 0)) + 1
+        run_starts = np.concatenate(([0], breaks))
+        run_ends = np.concatenate((breaks, [len(valid)]))
+
+        return [
+            (keys[key_id], base + int(start), base + int(stop), count)
+            for key_id, start, stop, count in zip(
+                ids[run_starts].tolist(),
+                starts[valid[run_starts]].tolist(),
+                line_stops[valid[run_ends - 1]].tolist(),
+                (run_ends - run_starts).tolist(),
+            )
+        ]
+
+    @staticmethod
+    def _decode(raw: bytes) -> str:
+        for encoding in ('utf-8', 'gbk', 'gb2312'):
+            try:
+                return raw.decode(encoding)
+            except UnicodeDecodeError:
+                continue
+        return raw.decode('utf-8', errors='replace')
+
     def save_date_batch(self, date_batch: DateBatch) -> str:
         """保存单个日期批次到临时文件"""
         temp_file = os.path.join(self.temp_dir, f"{self.metric_code}_{date_batch.trade_date}.txt")
@@ -233,9 +408,27 @@ class BatchImporter:
 
         return temp_file
 
-    def import_single_date(self, args: Tuple[str, str, str, int]) -> Tuple[str, bool, str]:
+    def task_source(self, date_batch: DateBatch):
+        """工作进程读取数据的来源：mmap模式为 (源文件, 字节区间)，lines模式为临时文件"""
+        if date_batch.ranges is not None:
+            return self.progress.file_path, date_batch.ranges
+        return self.save_date_batch(date_batch)
+
+    @staticmethod
+    def read_date_content(source) -> bytes:
+        """按 task_source 的结果读取单个日期的数据"""
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                return f.read()
+
+        file_path, ranges = source
+        with open(file_path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return b''.join(mm[start:stop] for start, stop in ranges.tolist())
+
+    def import_single_date(self, args: Tuple[str, object, str, int]) -> Tuple[str, bool, str]:
         """导入单个日期的数据（用于多进程）"""
-        trade_date_str, temp_file, metric_code, metric_type_id = args
+        trade_date_str, source, metric_code, metric_type_id = args
 
         try:
             # 创建新的数据库会话
@@ -244,9 +437,8 @@ class BatchImporter:
             # 解析日期
             trade_date = datetime.strptime(trade_date_str, '%Y-%m-%d').date()
 
-            # 读取临时文件
-            with open(temp_file, 'rb') as f:
-                file_content = f.read()
+            # 按偏移读取源文件区间（或lines模式的临时文件）
+            file_content = self.read_date_content(source)
 
             # 创建导入批次
             import_batch = ImportBatch(
@@ -319,8 +511,16 @@ class BatchImporter:
         # 准备任务
         tasks = []
         for trade_date, batch in dates_to_process:
-            temp_file = self.save_date_batch(batch)
-            tasks.append((trade_date, temp_file, self.metric_code, metric_type_id))
+            tasks.append((trade_date, self.task_source(batch), self.metric_code, metric_type_id))
+
+        # 股票-概念映射只在父进程加载一次，工作进程继承后逐日期校验签名
+        db = SessionLocal()
+        try:
+            snapshot = OptimizedTXTImportService.load_mapping_snapshot(db)
+        finally:
+            db.close()
+        share_mapping_snapshot(snapshot)
+        logger.info(f"已加载共享映射: {len(snapshot.valid_stocks)}个有效股票")
 
         # 创建进度条
         with tqdm(total=len(tasks), desc="导入进度") as pbar:
@@ -339,7 +539,11 @@ class BatchImporter:
                     self.save_progress()
             else:
                 # 多进程
-                with Pool(processes=self.parallel) as pool:
+                with Pool(
+                    processes=self.parallel,
+                    initializer=share_mapping_snapshot,
+                    initargs=(snapshot,)
+                ) as pool:
                     # 使用imap_unordered获取结果
                     for trade_date, success, msg in pool.imap_unordered(
                         self.import_single_date, tasks
@@ -394,7 +598,10 @@ class BatchImporter:
             )
 
         # 扫描文件
-        date_batches = self.scan_file(file_path)
+        if self.scan_mode == 'mmap':
+            date_batches = self.scan_file_mmap(file_path)
+        else:
+            date_batches = self.scan_file(file_path)
         self.progress.total_dates = len(date_batches)
 
         # 显示统计
@@ -451,6 +658,8 @@ def main():
     parser.add_argument('--resume', action='store_true', help='从上次中断处继续')
     parser.add_argument('--start-date', help='开始日期（YYYY-MM-DD）')
     parser.add_argument('--end-date', help='结束日期（YYYY-MM-DD）')
+    parser.add_argument('--scan-mode', choices=['mmap', 'lines'], default='mmap',
+                        help='扫描方式：mmap 记录字节区间（默认），lines 整文件读入并拆分临时文件')
 
     args = parser.parse_args()
 
@@ -462,7 +671,8 @@ def main():
     # 创建导入器
     importer = BatchImporter(
         metric_code=args.metric_code,
-        parallel=args.parallel
+        parallel=args.parallel,
+        scan_mode=args.scan_mode
     )
 
     try: